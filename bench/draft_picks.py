@@ -0,0 +1,102 @@
+"""
+Per-pick cost of pick validation and random-pick candidates: the old walk
+over every pick so far against Draft's incremental pool counters
+(can_pick / legal_picks). Also checks both agree on every step of a few
+random drafts.
+
+Run from the repository root:  python bench/draft_picks.py
+"""
+import random
+import sys
+import time
+from collections import defaultdict
+from os.path import dirname, join
+
+sys.path.insert(0, join(dirname(__file__), "..", "src"))
+
+from draft import POOL_MAPPING, POOLS, Draft, DraftPick  # noqa: E402
+
+N = 20_000
+
+
+def old_can_pick(draft: Draft, player: str, key: str) -> bool:
+    # What _do_pick did
+    if key in draft.picked:
+        return False
+    pl = POOL_MAPPING[key]
+    n = 0
+    for pk in draft.draft:
+        if POOL_MAPPING[pk.key] == pl and pk.player == player:
+            n += 1
+            if n >= draft.picks_per_pool:
+                return False
+    return True
+
+
+def old_legal(draft: Draft, player: str) -> set[str]:
+    # What random_pick did
+    o = defaultdict(lambda: draft.picks_per_pool)
+    allowed = {p.name.short_name: p for p in POOLS}
+    for pk in draft.draft:
+        if pk.player != player:
+            continue
+        n = POOL_MAPPING[pk.key].name.short_name
+        o[n] -= 1
+        if o[n] == 0:
+            allowed.pop(n)
+    return {k for a in allowed.values() for k in a.contains if k not in draft.picked}
+
+
+def pick(draft: Draft, key: str, player: str):
+    # execute_pick minus the room side of things
+    p = DraftPick(key=key, player=player, index=len(draft.draft))
+    draft.position.pop(0)
+    draft.draft.append(p)
+    if not draft.position:
+        draft.position = draft.next_positions
+        draft.next_positions = list(reversed(draft.next_positions))
+    draft.picked.add(key)
+    draft._counters.add(p)
+
+
+def play(players: int, seed: int) -> Draft:
+    random.seed(seed)
+    d = Draft.from_players({f"{i:032x}" for i in range(players)})
+    while len(d.draft) < d.max_picks:
+        player = d.position[0]
+        legal = d.legal_picks(player)
+        assert legal == old_legal(d, player), "legal picks disagree"
+        for key in POOL_MAPPING:
+            assert d.can_pick(player, key) == old_can_pick(d, player, key), key
+        pick(d, random.choice(sorted(legal)), player)
+    # And a reload rebuilds the same counters
+    assert Draft.model_validate_json(d.serialized()).legal_picks(d.position[0]) == d.legal_picks()
+    return d
+
+
+def per_call(fn, runs: int = 5) -> float:
+    best = float("inf")
+    for _ in range(runs):
+        started = time.perf_counter()
+        for _ in range(N):
+            fn()
+        best = min(best, time.perf_counter() - started)
+    return best / N * 1e6
+
+
+if __name__ == "__main__":
+    for players in (1, 2, 4):
+        for seed in range(5):
+            play(players, seed)
+    print("counters agree with the old loops")
+
+    # Late in a 4 player draft, where the old walk is longest
+    d = play(4, 0)
+    d = Draft.model_validate_json(d.serialized())
+    d.draft = d.draft[:-2]
+    d.picked = {pk.key for pk in d.draft}
+    d = Draft.model_validate_json(d.serialized())
+    player, key = d.position[0], next(iter(POOL_MAPPING))
+    print(f"{len(d.draft)} picks so far")
+    print(f"validate pick: {per_call(lambda: old_can_pick(d, player, key)):6.2f} us -> {per_call(lambda: d.can_pick(player, key)):6.2f} us")
+    print(f"legal picks:   {per_call(lambda: old_legal(d, player)):6.2f} us -> {per_call(lambda: d.legal_picks(player)):6.2f} us")
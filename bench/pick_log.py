@@ -0,0 +1,72 @@
+"""
+Cost of persisting one pick as a draft grows: the old full Draft JSON rewrite
+of rooms.draft against appending to the picks table and rewriting the small
+header. Uses a throwaway in-memory SQLite with the same tables.
+
+Run from the repository root:  python bench/pick_log.py
+"""
+import sqlite3
+import sys
+import time
+from os.path import dirname, join
+
+sys.path.insert(0, join(dirname(__file__), "..", "src"))
+
+from draft import POOL_MAPPING, Draft, DraftPick  # noqa: E402
+from models.ws import serialize  # noqa: E402
+
+PLAYERS = 8
+REPEAT = 200
+
+
+def setup() -> sqlite3.Connection:
+    db = sqlite3.connect(":memory:")
+    db.execute("CREATE TABLE rooms (id INTEGER PRIMARY KEY AUTOINCREMENT, code char(7) UNIQUE NOT NULL, draft VARCHAR)")
+    db.execute("CREATE TABLE picks (room char(7) NOT NULL, idx INTEGER NOT NULL, key TEXT NOT NULL, "
+               "player char(32) NOT NULL, PRIMARY KEY (room, idx)) WITHOUT ROWID")
+    db.execute("INSERT INTO rooms (code) VALUES ('BENCH01')")
+    return db
+
+
+def old_save(db: sqlite3.Connection, d: Draft, p: DraftPick):
+    db.execute("UPDATE rooms SET draft = ? WHERE code = 'BENCH01'", (serialize(d),))
+    db.commit()
+
+
+def new_save(db: sqlite3.Connection, d: Draft, p: DraftPick):
+    db.execute("INSERT OR REPLACE INTO picks (room, idx, key, player) VALUES ('BENCH01',?,?,?)", (p.index, p.key, p.player))
+    db.execute("UPDATE rooms SET draft = ? WHERE code = 'BENCH01'", (d.header(),))
+    db.commit()
+
+
+def draft_with(picks: int) -> tuple[Draft, DraftPick]:
+    players = [f"{n:032x}" for n in range(PLAYERS)]
+    d = Draft.from_players(set(players))
+    keys = list(POOL_MAPPING)
+    for n in range(picks):
+        p = DraftPick(key=keys[n % len(keys)], player=players[n % PLAYERS], index=n)
+        d.draft.append(p)
+        d.picked.add(p.key)
+    d.set_gambit(players[0], "some_gambit", True)
+    return d, d.draft[-1]
+
+
+def per_save(fn, db, d, p) -> float:
+    best = float("inf")
+    for _ in range(3):
+        started = time.perf_counter()
+        for _ in range(REPEAT):
+            fn(db, d, p)
+        best = min(best, time.perf_counter() - started)
+    return best / REPEAT * 1e6
+
+
+if __name__ == "__main__":
+    db = setup()
+    print(f"{'picks':>5} {'old bytes':>10} {'old us':>8} {'new bytes':>10} {'new us':>8}")
+    for picks in (1, 8, 16, 32):
+        d, p = draft_with(picks)
+        old_bytes = len(serialize(d))
+        new_bytes = len(d.header()) + len(p.key) + len(p.player) + 8
+        print(f"{picks:>5} {old_bytes:>10} {per_save(old_save, db, d, p):>8.1f} "
+              f"{new_bytes:>10} {per_save(new_save, db, d, p):>8.1f}")
@@ -0,0 +1,49 @@
+"""
+JSON vs the binary positions subprotocol (see positions.py): bytes on the wire
+for an upload and for a batched room update, and the cost of parsing an upload.
+
+Run from the repository root:  python bench/positions.py
+"""
+import sys
+import time
+from os.path import dirname, join
+
+sys.path.insert(0, join(dirname(__file__), "..", "src"))
+
+from models.ws import PositionUpload, WebSocketMessage, serialize  # noqa: E402
+from positions import UPLOAD, UPLOAD_TYPE, PositionRoute, binary_batch, json_batch  # noqa: E402
+
+N = 100_000
+PLAYERS = 8
+
+
+def best_of(fn, runs: int = 5) -> float:
+    best = float("inf")
+    for _ in range(runs):
+        started = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def main():
+    upload = PositionUpload(x=1234.5, y=64.0, z=-987.25, dimension="overworld")
+    js = serialize(upload)
+    packed = UPLOAD.pack(UPLOAD_TYPE, upload.x, upload.y, upload.z, 0)
+
+    uuids = [f"{n:032x}" for n in range(PLAYERS)]
+    positions = {u: (100.0 * i, 64.0, -50.0 * i, "overworld") for i, u in enumerate(uuids)}
+    routes = {u: PositionRoute("ABCDEFG", frozenset(uuids), i, 0) for i, u in enumerate(uuids)}
+    jb = json_batch("ABCDEFG", positions).data
+    bb = binary_batch(positions, routes).data
+
+    print(f"upload:  json {len(js):4d} B  binary {len(packed):4d} B  ({len(js) / len(packed):.1f}x)")
+    print(f"batch/{PLAYERS}: json {len(jb):4d} B  binary {len(bb):4d} B  ({len(jb) / len(bb):.1f}x)")
+
+    t_json = best_of(lambda: [WebSocketMessage.deserialize(js) for _ in range(N)])
+    t_bin = best_of(lambda: [UPLOAD.unpack(packed) for _ in range(N)])
+    print(f"parse:   json {t_json / N * 1e6:6.2f} us  binary {t_bin / N * 1e6:6.2f} us  ({t_json / t_bin:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
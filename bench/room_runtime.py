@@ -0,0 +1,97 @@
+"""
+Compares the pydantic Room models against the __slots__ runtime classes in
+models/runtime.py: construction cost from a stored rooms row, and memory held
+per room. Also times building the seed-redacted /draft/live payload.
+
+Run from the repository root:  python bench/room_runtime.py
+"""
+import random
+import sys
+import time
+import tracemalloc
+from os.path import dirname, join
+
+sys.path.insert(0, join(dirname(__file__), "..", "src"))
+
+from draft import POOLS, Draft, DraftPick, live_room_json  # noqa: E402
+from models.room import Room, RoomConfig, RoomState  # noqa: E402
+from models.runtime import RuntimeRoom  # noqa: E402
+from models.ws import deserialize, serialize  # noqa: E402
+from state import advancements  # noqa: E402
+
+N = 2000
+
+
+def fake_row(i: int) -> tuple[tuple, set[str], list[tuple[str, str]]]:
+    players = [f"{i:08x}" + "p" * 23 + str(n) for n in range(2)]
+    d = Draft.from_players(set(players))
+    keys = [k for p in POOLS for k in p.contains]
+    random.shuffle(keys)
+    for n, k in enumerate(keys[:d.max_picks]):
+        d.draft.append(DraftPick(key=k, player=players[n % 2], index=n))
+        d.picked.add(k)
+    d.complete = True
+    st = RoomState(overworld_seed="1", nether_seed="2", end_seed="3")
+    adv = sorted(advancements)
+    st.player_advancements = {p: set(random.sample(adv, 60)) for p in players}
+    row = (i, f"R{i:06d}", players[0], serialize(RoomConfig()), d.header(), serialize(st))
+    return row, set(players), [(pk.key, pk.player) for pk in d.draft]
+
+
+def as_pydantic(row: tuple, members: set[str], picks: list[tuple[str, str]]) -> Room:
+    # Same work as rooms.get_room_from_code after the SELECTs
+    return Room(code=row[1], members=members, admin=row[2],
+                config=deserialize(row[3], RoomConfig) or RoomConfig(),
+                draft=Draft.from_log(row[4], picks), state=deserialize(row[5], RoomState))
+
+
+def live_copy(room: Room) -> str:
+    # What publish_live_room used to do: copy the state, blank it, dump it all
+    st = room.state
+    newst = RoomState.model_copy(st)
+    newst.end_seed = None
+    newst.nether_seed = None
+    newst.overworld_seed = None
+    room.state = newst
+    js = serialize(room)
+    room.state = st
+    return js
+
+
+def bench(name, fn, rows, repeat=5):
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for r in rows:
+            fn(*r)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    print(f"{name:>10}: {best / len(rows) * 1e6:8.1f} us/room (best of {repeat})")
+
+
+def memory(name, fn, rows):
+    tracemalloc.start()
+    held = [fn(*r) for r in rows]
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{name:>10}: {size / len(held) / 1024:8.1f} KiB/room")
+
+
+if __name__ == "__main__":
+    random.seed(0)
+    rows = [fake_row(i) for i in range(N)]
+    # sanity: both sides agree on what the room is
+    assert RuntimeRoom.from_row(*rows[0]).to_model() == as_pydantic(*rows[0])
+
+    print(f"Building {N} rooms from stored rows")
+    bench("pydantic", as_pydantic, rows)
+    bench("runtime", RuntimeRoom.from_row, rows)
+    print("Memory held per room")
+    memory("pydantic", as_pydantic, rows)
+    memory("runtime", RuntimeRoom.from_row, rows)
+    models = [(as_pydantic(*r),) for r in rows]
+    assert live_room_json(*models[0]) == live_copy(*models[0])
+    print("Seed-redacted live payload")
+    bench("copy", live_copy, models, repeat=15)
+    bench("runtime", lambda r: RuntimeRoom.from_model(r).to_json(redact_seeds=True), models)
+    bench("spliced", live_room_json, models, repeat=15)
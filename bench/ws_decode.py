@@ -0,0 +1,50 @@
+"""
+Messages per second through the /listen decode path: the old json.loads +
+WebSocketMessage(message=...) against decode_message (prebuilt TypeAdapters,
+validate_json, variant sniffing).
+
+Run from the repository root:  python bench/ws_decode.py
+"""
+import json
+import sys
+import time
+from os.path import dirname, join
+
+sys.path.insert(0, join(dirname(__file__), "..", "src"))
+
+from models.ws import WebSocketMessage, decode_message  # noqa: E402
+
+N = 50_000
+
+MESSAGES = {
+    "PositionUpload": '{"variant": "PositionUpload", "x": 1234.5, "y": 64.0, "z": -987.25, "dimension": "overworld"}',
+    "AdvancementUpdate": '{"variant": "AdvancementUpdate", "advancement": "minecraft:story/mine_diamond"}',
+    "Heartbeat": '{"variant": "<3 you matter"}',
+    "roomaction": '{"variant": "roomaction", "action": "start"}',
+}
+
+
+def old_deserialize(data: str):
+    return WebSocketMessage(message=json.loads(data)).message
+
+
+def rate(fn, data: str, runs: int = 5) -> float:
+    best = float("inf")
+    for _ in range(runs):
+        started = time.perf_counter()
+        for _ in range(N):
+            fn(data)
+        best = min(best, time.perf_counter() - started)
+    return N / best
+
+
+def main():
+    for name, data in MESSAGES.items():
+        assert old_deserialize(data) == decode_message(data)
+        before = rate(old_deserialize, data)
+        after = rate(decode_message, data)
+        print(f"{name:18s} {before:10,.0f} msg/s -> {after:10,.0f} msg/s  ({after / before:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
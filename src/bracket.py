@@ -3,6 +3,8 @@ from fastapi.responses import JSONResponse
 from pydantic import BaseModel
 from fastapi import APIRouter, Request, Response
 
+from sse import feed
+
 rt = APIRouter(prefix="/bracket")
 
 # Hacking things together for now.
@@ -137,6 +139,7 @@ async def register_completion_manually(request: Request):
 
     global BRACKET_RESP
     BRACKET_RESP = d2_bracket_serialized()
+    BRACKET_FEED.publish(BRACKET_RESP)
 
 
 class MatchGame(BaseModel):
@@ -167,3 +170,8 @@ async def get_current_bracket():
         BRACKET_RESP,
         media_type=JSONResponse.media_type
     )
+
+BRACKET_FEED = feed("bracket", BRACKET_RESP)
+@rt.get("/external/current/stream")
+async def stream_current_bracket():
+    return BRACKET_FEED.response()
@@ -0,0 +1,123 @@
+import asyncio
+import json
+import os
+import time
+from typing import Iterable
+from uuid import uuid4
+
+import metrics
+from frames import Frame
+from utils import LOG, env_float
+
+"""
+Room events go out through a bus instead of straight to our sockets, so that
+more than one server process can share the rooms.
+
+publish() is called by whoever produced the event (broadcast_room, the
+position flush); every process then calls mg.deliver() for its own sockets.
+With the default LocalBus that's just this process. With SqliteBus, events are
+also written to a shared SQLite file that every worker polls, and the row id
+doubles as the room's sequence number so all workers agree on it.
+
+Pick DRAAFT_BUS=sqlite to run several workers. Only delivery is shared,
+though: the room executor's locks, pick timers, presence, the lobby index and
+the coalescer all stay per process, so each room's requests should still be
+routed to one worker. Picks are the one mutation guarded in the database:
+the pick log's (room, idx) key refuses a second pick at the same index, and
+pick timers check the stored pick count before picking.
+"""
+
+# How often SqliteBus workers look for events from other workers
+POLL_INTERVAL = env_float("DRAAFT_BUS_POLL", 0.05)
+# SqliteBus events older than this get cleaned up
+RETENTION = env_float("DRAAFT_BUS_RETENTION", 60)
+
+
+class LocalBus:
+    def publish(self, code: str, members: Iterable[str], frame: Frame,
+                binary: Frame | None = None, sequenced: bool = True):
+        from room_manager import mg
+        mg.deliver(code, members, frame, binary, sequenced)
+
+    async def run(self):
+        pass
+
+
+class SqliteBus(LocalBus):
+    def __init__(self, path: str):
+        from db import LockableSqliteConnection
+        self.db = LockableSqliteConnection(path)
+        # Identifies our own rows, which we deliver without waiting for a poll
+        self.origin = f"{os.getpid()}-{uuid4().hex[:8]}"
+        with self.db as cur:
+            cur.execute("PRAGMA journal_mode=WAL")
+            cur.execute(
+                "CREATE TABLE IF NOT EXISTS bus_events("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, origin TEXT, code TEXT, members TEXT, "
+                "sequenced INTEGER, payload TEXT, binary BLOB, created REAL)"
+            )
+            cur.execute("CREATE INDEX IF NOT EXISTS bus_events_created ON bus_events(created)")
+            cur.execute("SELECT MAX(id) FROM bus_events")
+            self.last_id: int = cur.fetchone()[0] or 0
+        self.last_prune = time.monotonic()
+
+    def publish(self, code: str, members: Iterable[str], frame: Frame,
+                binary: Frame | None = None, sequenced: bool = True):
+        from room_manager import mg
+        members = list(members)
+        with self.db as cur:
+            cur.execute(
+                "INSERT INTO bus_events(origin, code, members, sequenced, payload, binary, created) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (self.origin, code, json.dumps(members), int(sequenced), frame.text,
+                 binary.data if binary is not None else None, time.time()),
+            )
+            seq = cur.lastrowid
+        metrics.incr("bus.published")
+        mg.deliver(code, members, frame, binary, sequenced, seq if sequenced else None)
+
+    def poll(self):
+        from room_manager import mg
+        with self.db as cur:
+            cur.execute(
+                "SELECT id, origin, code, members, sequenced, payload, binary FROM bus_events WHERE id > ? ORDER BY id",
+                (self.last_id,),
+            )
+            rows = cur.fetchall()
+        for id, origin, code, members, sequenced, payload, binary in rows:
+            self.last_id = id
+            if origin == self.origin:
+                continue
+            metrics.incr("bus.received")
+            mg.deliver(code, json.loads(members), Frame(payload),
+                       Frame.binary(binary) if binary is not None else None,
+                       bool(sequenced), id if sequenced else None, remote=True)
+
+    def prune(self):
+        now = time.monotonic()
+        if now - self.last_prune < RETENTION:
+            return
+        self.last_prune = now
+        with self.db as cur:
+            cur.execute("DELETE FROM bus_events WHERE created < ?", (time.time() - RETENTION,))
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(POLL_INTERVAL)
+            try:
+                self.poll()
+                self.prune()
+            except Exception as e:
+                print(f"Warning: Bus poll failed: {e}")
+
+
+def make_bus() -> LocalBus:
+    kind = os.environ.get("DRAAFT_BUS", "local")
+    if kind == "sqlite":
+        path = os.environ.get("DRAAFT_BUS_PATH", "./db/bus.db")
+        LOG("Using sqlite bus at", path)
+        return SqliteBus(path)
+    return LocalBus()
+
+
+BUS = make_bus()
@@ -0,0 +1,113 @@
+import asyncio
+import heapq
+import time
+from typing import Iterable
+
+from pydantic import BaseModel
+
+import metrics
+from frames import Frame
+
+"""
+Latest-wins debouncing for room broadcasts.
+
+A message model opts in by defining coalesce() -> (key, window) | None (see
+models/ws.py). broadcast_room hands those frames here instead of publishing
+them: the first one for a (room, key) is held for `window` seconds, anything
+with the same key arriving meanwhile just replaces it, and one scheduler task
+publishes whatever is latest when the window closes. Any broadcast that isn't
+coalesced flushes the room's pending ones first, so order is kept.
+
+Models whose updates aren't simply superseded also define merge(earlier),
+which folds the pending message into the new one instead.
+"""
+
+
+class Pending:
+    __slots__ = ("deadline", "members", "frame")
+
+    def __init__(self, deadline: float, members: list[str], frame: Frame):
+        self.deadline = deadline
+        self.members = members
+        self.frame = frame
+
+
+class Coalescer:
+    def __init__(self):
+        self.pending: dict[tuple[str, str], Pending] = dict()
+        self.heap: list[tuple[float, str, str]] = list()
+        self.wakeup = asyncio.Event()
+
+    def submit(self, code: str, members: Iterable[str], frame: Frame, key: str, window: float,
+               msg: BaseModel | None = None):
+        p = self.pending.get((code, key))
+        if p is not None:
+            merge = getattr(msg, "merge", None)
+            if merge is not None and p.frame.text is not None:
+                # The pending one may have come back from a snapshot as bare
+                # JSON, so it's parsed again rather than kept as a model
+                metrics.incr("coalesce.merged")
+                frame = Frame.of(merge(type(msg).model_validate_json(p.frame.text)))
+            else:
+                metrics.incr("coalesce.replaced")
+            p.members = list(members)
+            p.frame = frame
+            return
+        deadline = time.monotonic() + window
+        self.pending[(code, key)] = Pending(deadline, list(members), frame)
+        heapq.heappush(self.heap, (deadline, code, key))
+        self.wakeup.set()
+
+    def flush_due(self, now: float) -> float | None:
+        # Publishes everything due, returns when the next thing is due
+        from bus import BUS
+        while self.heap and self.heap[0][0] <= now:
+            _, code, key = heapq.heappop(self.heap)
+            p = self.pending.pop((code, key), None)
+            if p is None:
+                continue
+            metrics.incr("coalesce.flushed")
+            BUS.publish(code, p.members, p.frame)
+        return self.heap[0][0] if self.heap else None
+
+    def flush_room(self, code: str):
+        # Something for this room is going out right away (a leave, a kick,
+        # ...). Whatever we're still holding for it goes first, so nobody gets
+        # e.g. a stale status swap after the player already left.
+        from bus import BUS
+        if not self.pending:
+            return
+        for k in [k for k in self.pending if k[0] == code]:
+            p = self.pending.pop(k)
+            metrics.incr("coalesce.flushed_early")
+            BUS.publish(code, p.members, p.frame)
+
+    def drop_room(self, code: str):
+        for k in [k for k in self.pending if k[0] == code]:
+            del self.pending[k]
+
+    def dump(self) -> list[dict]:
+        now = time.monotonic()
+        return [
+            {"code": code, "key": key, "members": p.members, "frame": p.frame.text,
+             "delay": max(p.deadline - now, 0)}
+            for (code, key), p in self.pending.items()
+        ]
+
+    async def run(self):
+        while True:
+            self.wakeup.clear()
+            try:
+                next_due = self.flush_due(time.monotonic())
+            except Exception as e:
+                print(f"Warning: Coalesced flush failed: {e}")
+                next_due = None
+            timeout = None if next_due is None else max(next_due - time.monotonic(), 0)
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+
+COALESCER = Coalescer()
+metrics.register_collector("coalesce", lambda: {"pending": len(COALESCER.pending)})
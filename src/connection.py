@@ -0,0 +1,126 @@
+import asyncio
+import time
+
+from fastapi import WebSocket
+
+import metrics
+from frames import Frame
+from utils import LOG, env_float
+
+# Max frames waiting for one socket before we decide it's a slow consumer
+SEND_QUEUE_SIZE = int(env_float("DRAAFT_WS_QUEUE_SIZE", 256))
+# Close code for evicted sockets: 1013 = try again later, so clients reconnect
+SLOW_CONSUMER_CLOSE = 1013
+
+
+class Connection:
+    """
+    One accepted /listen socket.
+
+    Nothing writes to the socket directly: send() just enqueues, and a writer
+    task per socket drains the queue. A stalled socket only ever blocks
+    itself, and once its queue is full it gets disconnected.
+    """
+
+    def __init__(self, ws: WebSocket, uuid: str, binary_positions: bool = False, compress: bool = False):
+        self.ws = ws
+        self.uuid = uuid
+        # Negotiated positions subprotocol, see positions.py
+        self.binary_positions = binary_positions
+        # Client accepts compressed large frames, see frames.py
+        self.compress = compress
+        self.queue: asyncio.Queue[tuple[Frame, float]] = asyncio.Queue(maxsize=SEND_QUEUE_SIZE)
+        self.closed = False
+        # Liveness, see heartbeat.py. Clients that have answered a heartbeat
+        # get held to the idle deadline, the rest to whether our writes still
+        # go through.
+        self.last_seen = time.monotonic()
+        self.last_sent = time.monotonic()
+        self.heartbeats = False
+        # Room the user is a member of, and other rooms this socket follows.
+        # Kept in sync with RoomManager.rooms, see room_manager.py
+        self.room: str | None = None
+        self.watching: set[str] = set()
+        # Rooms this socket spectates -> its tier in each, see spectators.py
+        self.spectating: dict[str, str] = dict()
+        self.writer = asyncio.create_task(self._drain())
+        CONNECTIONS.add(self)
+
+    def send(self, frame: Frame) -> bool:
+        if self.closed:
+            return False
+        try:
+            self.queue.put_nowait((frame, time.monotonic()))
+        except asyncio.QueueFull:
+            LOG("Evicting slow websocket consumer", self.uuid)
+            metrics.incr("ws.slow_consumer_evictions")
+            self.evict()
+            return False
+        return True
+
+    async def _drain(self):
+        try:
+            while True:
+                frame, queued_at = await self.queue.get()
+                z = frame.compressed() if self.compress else None
+                if z is not None:
+                    await self.ws.send_bytes(z)
+                elif frame.text is None:
+                    await self.ws.send_bytes(frame.data)
+                else:
+                    await self.ws.send_text(frame.text)
+                self.last_sent = time.monotonic()
+                metrics.observe("ws.send_latency_seconds", self.last_sent - queued_at)
+                metrics.incr("ws.frames_sent")
+                metrics.incr("ws.bytes_sent", len(z) if z is not None else len(frame.data))
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # Socket went away under us; the receive loop will clean up
+            LOG("Websocket writer for", self.uuid, "stopped:", e)
+            self.closed = True
+
+    def rooms(self) -> set[str]:
+        return self.watching | {self.room} if self.room is not None else set(self.watching)
+
+    def touch(self):
+        self.last_seen = time.monotonic()
+
+    def stalled(self, now: float, timeout: float) -> bool:
+        # Our writes aren't getting out: the writer died on a send error, or
+        # it's been stuck on one send with frames waiting for `timeout`
+        return self.writer.done() or (not self.queue.empty() and now - self.last_sent > timeout)
+
+    def evict(self, code: int = SLOW_CONSUMER_CLOSE):
+        self.close()
+        asyncio.create_task(self._close_socket(code))
+
+    async def _close_socket(self, code: int):
+        try:
+            await self.ws.close(code=code)
+        except Exception:
+            pass
+
+    def close(self):
+        self.closed = True
+        self.writer.cancel()
+        CONNECTIONS.discard(self)
+
+
+CONNECTIONS: set[Connection] = set()
+
+
+def connection_stats() -> dict:
+    depths = {c: c.queue.qsize() for c in CONNECTIONS}
+    slowest = sorted(depths.items(), key=lambda x: x[1], reverse=True)[:5]
+    zin = metrics.COUNTERS.get("ws.compress_bytes_in", 0)
+    return {
+        "compression_ratio": metrics.COUNTERS.get("ws.compress_bytes_out", 0) / zin if zin else None,
+        "connections": len(CONNECTIONS),
+        "queued_frames": sum(depths.values()),
+        "max_queue_depth": max(depths.values(), default=0),
+        "slowest": [{"uuid": c.uuid, "depth": d} for c, d in slowest if d],
+    }
+
+
+metrics.register_collector("ws", connection_stats)
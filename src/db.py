@@ -1,9 +1,8 @@
-from collections import defaultdict
 import sqlite3
 from draft import Draft
 
 from models.generic import LoggedInUser
-from typing import Any, DefaultDict
+from typing import Any
 
 from models.room import Room
 import threading
@@ -54,6 +53,40 @@ def do_migrations():
             cur.execute("ALTER TABLE completions ADD COLUMN tag char(32);")
         set_metadata(VERSION_KEY, "2")
 
+    if db_version < 3:
+        LOG("-> Database version was < 3. Performing migration to version 3.")
+        migrate_pick_log()
+        set_metadata(VERSION_KEY, "3")
+
+
+def migrate_pick_log():
+    # Picks move out of the rooms.draft JSON into an append-only table, which
+    # leaves rooms.draft holding just the header (see draft.HEADER_EXCLUDE)
+    import json
+    from draft import HEADER_EXCLUDE
+    with sql as cur:
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS picks (
+                room char(7) NOT NULL,
+                idx INTEGER NOT NULL,
+                key TEXT NOT NULL,
+                player char(32) NOT NULL,
+                PRIMARY KEY (room, idx)
+            ) WITHOUT ROWID;
+        """)
+        drafts = cur.execute("SELECT code, draft FROM rooms WHERE draft IS NOT NULL").fetchall()
+        for code, js in drafts:
+            try:
+                d = json.loads(js)
+            except ValueError:
+                continue
+            cur.executemany(
+                "INSERT OR IGNORE INTO picks (room, idx, key, player) VALUES (?,?,?,?)",
+                [(code, i, p["key"], p["player"]) for i, p in enumerate(d.get("draft", []))],
+            )
+            header = {k: v for k, v in d.items() if k not in HEADER_EXCLUDE}
+            cur.execute("UPDATE rooms SET draft = ? WHERE code = ?", (json.dumps(header), code))
+
 
 
 def setup_sqlite():
@@ -194,6 +227,15 @@ def get_user_status(uuid: str) -> str:
         return "player"
 
 
+def get_user_statuses(uuids: list[str]) -> dict[str, str]:
+    # get_user_status for a whole room in one query
+    fmt = ",".join("?" * len(uuids))
+    with sql as cur:
+        res = cur.execute(f"SELECT uuid, status FROM status WHERE uuid IN ({fmt})", uuids).fetchall()
+    found = dict(res)
+    return {u: found.get(u, "player") for u in uuids}
+
+
 def get_user(username: str, uuid: str) -> LoggedInUser | None:
     """ Gets a user by UUID. If the user does not exist, it is created. """
     # TODO - update username if changed or be dynamic elsewhere
@@ -222,16 +264,10 @@ def try_get_user(uuid: str) -> LoggedInUser | None:
     _, uuid, stored_username, room_code = res[0]
     return LoggedInUser(username=stored_username, uuid=uuid, room_code=room_code, status=get_user_status(uuid))
 
-class UUIDState:
-    def __init__(self):
-        self.connections = 0
-memory_db: DefaultDict[str, UUIDState] = defaultdict(lambda: UUIDState())
-
 class PopulatedUser:
     def __init__(self, user: LoggedInUser):
         self.source = user
         self.uuid = user.uuid
-        self.state = memory_db[self.uuid]
 
     # Convenience method. Get the room that this user is in.
     def get_room(self) -> Room | None:
@@ -1,3 +1,5 @@
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
 from fastapi import HTTPException
 from db import PopulatedUser, get_populated_user_from_request, populated_user
 from draft import Draft
@@ -12,29 +14,32 @@ def always_get_populated_user_from_request(request) -> PopulatedUser:
     return populated_user(u)
 
 
-def always_get_drafting_player(request) -> tuple[PopulatedUser, Room, Draft]:
-    # Gets a user, room, and draft IFF the user is a player in the draft
-    # okay, technically does not check if the draft is complete
-    u = always_get_populated_user_from_request(request)
-    r = u.get_room()
+def _check_drafting_user(u: PopulatedUser, r: Room | None) -> tuple[PopulatedUser, Room, Draft]:
     if r is None:
         raise HTTPException(status_code=404, detail="Could not get room for user.")
     if r.draft is None:
         raise HTTPException(status_code=404, detail=f"Could not get draft for room {r.code}")
-    if u.uuid not in r.draft.players:
-        raise HTTPException(status_code=403, detail=f"{u.uuid} is not a player for room {r.code}")
     return (u, r, r.draft)
 
+
+def _check_drafting_player(u: PopulatedUser, r: Room | None) -> tuple[PopulatedUser, Room, Draft]:
+    u, r, d = _check_drafting_user(u, r)
+    if u.uuid not in d.players:
+        raise HTTPException(status_code=403, detail=f"{u.uuid} is not a player for room {r.code}")
+    return (u, r, d)
+
+
+def always_get_drafting_player(request) -> tuple[PopulatedUser, Room, Draft]:
+    # Gets a user, room, and draft IFF the user is a player in the draft
+    # okay, technically does not check if the draft is complete
+    u = always_get_populated_user_from_request(request)
+    return _check_drafting_player(u, u.get_room())
+
 def always_get_drafting_user(request) -> tuple[PopulatedUser, Room, Draft]:
     # Gets a user, room, and draft IFF the user is a player in the draft
     # okay, technically does not check if the draft is complete
     u = always_get_populated_user_from_request(request)
-    r = u.get_room()
-    if r is None:
-        raise HTTPException(status_code=404, detail="Could not get room for user.")
-    if r.draft is None:
-        raise HTTPException(status_code=404, detail=f"Could not get draft for room {r.code}")
-    return (u, r, r.draft)
+    return _check_drafting_user(u, u.get_room())
 
 def always_get_gaming_player(request) -> tuple[PopulatedUser, Room, Draft, RoomState]:
     u, r, d = always_get_drafting_player(request)
@@ -43,7 +48,9 @@ def always_get_gaming_player(request) -> tuple[PopulatedUser, Room, Draft, RoomS
     return (u, r, d, r.state)
 
 def into_gaming_player(p: PopulatedUser) -> None | tuple[Room, Draft]:
-    r = p.get_room()
+    return _as_gaming_player(p, p.get_room())
+
+def _as_gaming_player(p: PopulatedUser, r: Room | None) -> None | tuple[Room, Draft]:
     if r is None:
         return None
     if r.draft is None:
@@ -53,3 +60,71 @@ def into_gaming_player(p: PopulatedUser) -> None | tuple[Room, Draft]:
     if not r.draft.complete:
         return None
     return (r, r.draft)
+
+
+# Locked variants of the above. The room is loaded only once its lock is held,
+# so whatever we check here is still true when the mutation happens.
+def _always_get_room_code(u: PopulatedUser) -> str:
+    from rooms import get_user_room_code
+    code = get_user_room_code(u.uuid)
+    if code is None:
+        raise HTTPException(status_code=404, detail="Could not get room for user.")
+    return code
+
+
+@asynccontextmanager
+async def locked_drafting_player(request) -> AsyncIterator[tuple[PopulatedUser, Room, Draft]]:
+    from room_executor import EXECUTOR
+    u = always_get_populated_user_from_request(request)
+    async with EXECUTOR.mutate(_always_get_room_code(u)) as r:
+        yield _check_drafting_player(u, r)
+
+
+@asynccontextmanager
+async def locked_drafting_user(request) -> AsyncIterator[tuple[PopulatedUser, Room, Draft]]:
+    from room_executor import EXECUTOR
+    u = always_get_populated_user_from_request(request)
+    async with EXECUTOR.mutate(_always_get_room_code(u)) as r:
+        yield _check_drafting_user(u, r)
+
+
+@asynccontextmanager
+async def locked_gaming_player(p: PopulatedUser) -> AsyncIterator[None | tuple[Room, Draft]]:
+    from rooms import get_user_room_code
+    from room_executor import EXECUTOR
+    code = get_user_room_code(p.uuid)
+    if code is None:
+        yield None
+        return
+    async with EXECUTOR.mutate(code) as r:
+        yield _as_gaming_player(p, r)
+
+
+@asynccontextmanager
+async def locked_user_room(p: PopulatedUser) -> AsyncIterator[Room | None]:
+    from rooms import get_user_room_code
+    from room_executor import EXECUTOR
+    code = get_user_room_code(p.uuid)
+    if code is None:
+        yield None
+        return
+    async with EXECUTOR.mutate(code) as r:
+        yield r
+
+
+@asynccontextmanager
+async def locked_admin_in_unstarted_room(request) -> AsyncIterator[tuple[PopulatedUser, Room] | None]:
+    from utils import LOG
+    u = get_populated_user_from_request(request)
+    if u is None:
+        yield None
+        return
+    async with locked_user_room(u) as r:
+        if r is None or u.uuid != r.admin:
+            LOG("-> no admin found from request")
+            yield None
+        elif r.drafting():
+            LOG("-> room was already started")
+            yield None
+        else:
+            yield (u, r)
@@ -1,14 +1,15 @@
 from collections import defaultdict
 from enum import Enum
-from typing import DefaultDict, Literal, Any, Callable
+from typing import DefaultDict, Iterable, Literal, Any, Callable
 from typing_extensions import override
 from fastapi.responses import FileResponse, JSONResponse
-from pydantic import BaseModel
+from pydantic import BaseModel, PrivateAttr
 from fastapi import APIRouter, HTTPException, Request, Response
 from datetime import date
 
 from datapack.datapack import Datapack, FeatureGranter, CustomGranter, LambdaGranter, FileGranter
 from datapack.luck import LuckGranter
+from sse import feed
 
 rt = APIRouter(prefix="/draft")
 
@@ -559,27 +560,113 @@ class DraftPick(BaseModel):
 
 GambitKey = str # key of the gambit
 
+# Picks are stored in their own append-only table (see db.py), rooms.draft
+# only holds the rest: a small header that doesn't grow as picks happen.
+# Everything left out here gets rebuilt from the pick log by replay_draft.
+HEADER_EXCLUDE = {"draft", "picked", "position", "next_positions"}
+
+
+def replay_draft(header: dict, picks: Iterable[tuple[str, str]]) -> dict:
+    """
+    Draft fields from a stored header plus its (key, player) picks in order.
+    Positions aren't stored: they snake through players one pick at a time,
+    same as execute_pick moves them.
+    """
+    players = header.get("players", [])
+    position = list(players)
+    next_positions = list(reversed(players))
+    draft = list()
+    picked = list()
+    for i, (key, player) in enumerate(picks):
+        draft.append({"key": key, "player": player, "index": i})
+        picked.append(key)
+        if position:
+            position.pop(0)
+        if not position:
+            position = next_positions
+            next_positions = list(reversed(next_positions))
+    return {**header, "draft": draft, "picked": picked, "position": position, "next_positions": next_positions}
+
+
 
 class DraftPickUpdate(DraftPick):
     variant: Literal["draftpick"] = "draftpick"
     positions: list[str]
     next_positions: list[str]
-
+    # What whoever picks next is allowed to pick
+    legal: list[str] = list()
+
+
+
+def pool_limit(pool: DraftPool, limit: int, oq: bool = False) -> int:
+    # Open qualifier submissions leave a few keys in every pool
+    return min(limit, pool.oq_pick_count()) if oq else limit
+
+
+class PickCounters:
+    """
+    Per-player, per-pool pick counts and the unpicked keys of every pool, so
+    checking a pick (or listing the legal ones) doesn't walk the whole draft.
+    """
+
+    __slots__ = ("picks", "available")
+
+    def __init__(self, draft: "Draft"):
+        # player -> pool short name -> number of picks
+        self.picks: dict[str, dict[str, int]] = dict()
+        # pool short name -> keys nobody has picked yet
+        self.available: dict[str, set[str]] = {p.name.short_name: set(p.contains) - draft.picked for p in POOLS}
+        for pk in draft.draft:
+            self.add(pk)
+
+    def __eq__(self, other):
+        # Pydantic compares private attributes too, so equal drafts need this
+        if not isinstance(other, PickCounters):
+            return NotImplemented
+        return self.picks == other.picks and self.available == other.available
+
+    def add(self, pk: DraftPick):
+        pool = POOL_MAPPING[pk.key].name.short_name
+        counts = self.picks.get(pk.player)
+        if counts is None:
+            counts = self.picks[pk.player] = dict()
+        counts[pool] = counts.get(pool, 0) + 1
+        self.available[pool].discard(pk.key)
+
+    def can_pick(self, player: str, key: str, limit: int, oq: bool = False) -> bool:
+        pool = POOL_MAPPING.get(key)
+        if pool is None:
+            return False
+        name = pool.name.short_name
+        if key not in self.available[name]:
+            return False
+        return self.picks.get(player, {}).get(name, 0) < pool_limit(pool, limit, oq)
+
+    def legal(self, player: str, limit: int, oq: bool = False) -> set[str]:
+        counts = self.picks.get(player, {})
+        legal = set()
+        for p in POOLS:
+            name = p.name.short_name
+            if counts.get(name, 0) < pool_limit(p, limit, oq):
+                legal |= self.available[name]
+        return legal
 
 
 def publish_live_room(room):
     from draft import set_live_status
+    set_live_status(live_room_json(room))
+
+def live_room_json(room) -> str:
+    from models.room import Room
     from models.ws import serialize
-    from models.room import Room, RoomState
     assert isinstance(room, Room)
-    st = room.state
-    newst = RoomState.model_copy(st)
-    newst.end_seed = None
-    newst.nether_seed = None
-    newst.overworld_seed = None
-    room.state = newst
-    set_live_status(serialize(room))
-    room.state = st
+    # Serialize once and blank the seeds in the JSON, no copies. state is
+    # Room's last field and starts with the three seeds, so everything up to
+    # player_advancements gets swapped out.
+    js = serialize(room)
+    start = js.rindex('"state":{')
+    end = js.index('"player_advancements":', start)
+    return js[:start] + '"state":{"overworld_seed":null,"nether_seed":null,"end_seed":null,' + js[end:]
 
 class Draft(BaseModel):
     @staticmethod
@@ -603,6 +690,19 @@ class Draft(BaseModel):
 
         return Draft(players=p, position=list(p), next_positions=list(reversed(p)), max_picks=max_picks, picks_per_pool=picks_per)
 
+    @staticmethod
+    def from_log(header: str | None, picks: Iterable[tuple[str, str]]) -> "Draft | None":
+        import json
+        if header is None:
+            return None
+        try:
+            return Draft(**replay_draft(json.loads(header), picks))
+        except Exception:
+            return None
+
+    def header(self) -> str:
+        return self.model_dump_json(exclude=HEADER_EXCLUDE)
+
     def serialized(self) -> str:
         from models.ws import serialize
 
@@ -621,9 +721,23 @@ class Draft(BaseModel):
         else:
             self.gambits[player_uuid].remove(gambit)
 
+    def model_post_init(self, __context: Any):
+        # Rebuilt from the picks on load, then kept up to date by execute_pick
+        self._counters = PickCounters(self)
+
+    def can_pick(self, player: str, key: str, oq: bool = False) -> bool:
+        return self._counters.can_pick(player, key, self.picks_per_pool, oq)
+
+    def legal_picks(self, player: str | None = None, oq: bool = False) -> set[str]:
+        # Defaults to whoever is picking now
+        if player is None:
+            if not self.position:
+                return set()
+            player = self.position[0]
+        return self._counters.legal(player, self.picks_per_pool, oq)
+
     async def random_pick(self, room):
         from models.room import Room
-        from collections import defaultdict
         assert isinstance(room, Room)
 
         from utils import LOG
@@ -633,31 +747,11 @@ class Draft(BaseModel):
             return
 
         uuid = self.position[0]
-        
-        ppp = self.picks_per_pool
-        o = defaultdict(lambda: ppp)
-        allowed = {p.name.short_name: p for p in POOLS}
-
-        for pk in self.draft:
-            if pk.player != uuid:
-                continue
-            p = POOL_MAPPING[pk.key]
-            n = p.name.short_name
-            o[n] -= 1
-            if o[n] == 0:
-                allowed.pop(n)
-
-        keys = []
-        for a in allowed.values():
-            for k in a.contains:
-                if k in self.picked:
-                    continue
-                # unpicked and allowed
-                keys.append(k)
+        keys = self.legal_picks(uuid, room.config.open_qualifier_submission)
         if not keys:
             raise RuntimeError(f"Could not random pick {self} {self.draft} {uuid}")
         from random import choice
-        k = choice(keys)
+        k = choice(sorted(keys))
         await self.execute_pick(k, uuid, room)
 
 
@@ -668,8 +762,8 @@ class Draft(BaseModel):
     async def do_completion(self, room, update=False):
         from room_manager import mg
         from rooms import update_draft
-        from models.room import PICK_TIMERS, Room
-        from models.ws import RoomUpdate, RoomUpdateEnum
+        from models.room import cancel_pick_timer, Room
+        from frames import DRAFT_COMPLETE
         assert isinstance(room, Room)
 
         if self.sent_complete:
@@ -679,15 +773,14 @@ class Draft(BaseModel):
         self.complete = True
 
         # might already be done
-        if room.code in PICK_TIMERS:
-            PICK_TIMERS[room.code].cancel()
+        cancel_pick_timer(room.code)
 
         if update:
             update_draft(self, room.code)
 
         await mg.broadcast_room(
             room,
-            RoomUpdate(update=RoomUpdateEnum.draft_complete),
+            DRAFT_COMPLETE,
         )
 
         self.sent_complete = True
@@ -706,7 +799,7 @@ class Draft(BaseModel):
     async def execute_pick(self, key: str, player: str, room):
         from room_manager import mg
         from rooms import update_draft
-        from models.room import pick_timer, PICK_TIMERS, Room
+        from models.room import arm_pick_timer, cancel_pick_timer, Room
         assert isinstance(room, Room)
 
         # MUST CHECK IF WE ARE COMPLETE
@@ -722,18 +815,18 @@ class Draft(BaseModel):
             self.next_positions = list(reversed(self.next_positions))
 
         self.picked.add(key)
+        self._counters.add(p)
 
         # if the draft is complete...
         if len(self.draft) >= self.max_picks:
             self.complete = True
 
-        if not update_draft(self, room.code):
+        if not update_draft(self, room.code, p):
             raise HTTPException(
                 status_code=500, detail="Could not update draft internally..!"
             )
 
-        if room.code in PICK_TIMERS:
-            PICK_TIMERS[room.code].cancel()
+        cancel_pick_timer(room.code)
 
         await mg.broadcast_room(
             room,
@@ -743,6 +836,7 @@ class Draft(BaseModel):
                 index=p.index,
                 positions=self.position,
                 next_positions=self.next_positions,
+                legal=sorted(self.legal_picks(oq=room.config.open_qualifier_submission)),
             ),
         )
 
@@ -756,8 +850,7 @@ class Draft(BaseModel):
 
         #### Only if not complete.
         if room.config.enforce_timer:
-            import asyncio
-            asyncio.create_task(pick_timer(room))
+            arm_pick_timer(room)
 
 
     players: list[str] = list()
@@ -779,6 +872,9 @@ class Draft(BaseModel):
     max_picks: int
     picks_per_pool: int
 
+    # Not serialized, see model_post_init
+    _counters: "PickCounters" = PrivateAttr()
+
 
 @rt.get("/status")
 async def get_status(request: Request) -> Draft:
@@ -793,6 +889,20 @@ async def get_status(request: Request) -> Draft:
     return ru[2]
 
 
+@rt.get("/legal")
+async def get_legal_picks(request: Request) -> list[str]:
+    # What the requesting player could pick right now, same rules as /pick
+    from db import get_started_room
+
+    ru = get_started_room(request)
+    if ru is None:
+        raise HTTPException(status_code=404, detail="no valid draft found")
+    user, room, draft = ru
+    if draft.complete or not draft.position or draft.position[0] != user.uuid:
+        return []
+    return sorted(draft.legal_picks(user.uuid, room.config.open_qualifier_submission))
+
+
 @rt.get("/draftables")
 async def get_draftables() -> tuple[list[DraftPool], dict[str, Draftable], dict[str, Gambit]]:
     return (POOLS, DRAFTABLES, GAMBITABLES)
@@ -831,9 +941,20 @@ async def get_tournament_game(request: Request):
             )
 
 
+# Overlays can hold this open instead of polling /external/livestatus
+LIVE_FEED = feed("livestatus", LIVE_STATUS)
+@rt.get("/external/livestatus/stream")
+async def stream_tournament_game(request: Request):
+    from visitors import increment
+    # Counted once per stream rather than once per poll
+    increment(request, "live")
+    return LIVE_FEED.response()
+
+
 def set_live_status(room_str: str):
     global LIVE_STATUS
     LIVE_STATUS = room_str
+    LIVE_FEED.publish(room_str)
 
 
 @rt.get("/download")
@@ -877,11 +998,14 @@ async def download_worldgen(request: Request) -> Response:
 
 
 async def update_gambit(request: Request, key: str, value: bool):
-    from db_utils import always_get_drafting_player
-    from room_manager import mg
-    from rooms import update_draft
+    from db_utils import locked_drafting_player
 
-    user, room, draft = always_get_drafting_player(request)
+    async with locked_drafting_player(request) as (user, room, draft):
+        await _update_gambit(user, room, draft, key, value)
+
+
+async def _update_gambit(user, room, draft: "Draft", key: str, value: bool):
+    from rooms import update_draft
 
     if not room.config.enable_gambits:
         raise HTTPException(status_code=403, detail='Gambits are disabled for this room.')
@@ -918,11 +1042,14 @@ async def disable_gambit(request: Request, key: str):
 
 @rt.post("/finish")
 async def finish_draft(request: Request):
-    from db_utils import always_get_drafting_user
+    from db_utils import locked_drafting_user
 
     # TODO. Should the creator of the room be able to finish it..?
-    user, room, draft = always_get_drafting_user(request)
+    async with locked_drafting_user(request) as (user, room, draft):
+        await _finish_draft(user, room, draft)
+
 
+async def _finish_draft(user, room, draft: "Draft"):
     if draft.sent_complete:
         raise HTTPException(status_code=403, detail="draft/finish cannot be done once the draft is complete!")
 
@@ -946,10 +1073,13 @@ async def finish_draft(request: Request):
 
 @rt.post("/pick")
 async def do_pick(request: Request, key: str):
-    from db_utils import always_get_drafting_player
+    from db_utils import locked_drafting_player
 
-    user, room, draft = always_get_drafting_player(request)
+    async with locked_drafting_player(request) as (user, room, draft):
+        await _do_pick(user, room, draft, key)
 
+
+async def _do_pick(user, room, draft: "Draft", key: str):
     if user.uuid != draft.position[0]:
         raise HTTPException(status_code=403, detail="You cannot pick right now.")
     if key not in DRAFTABLES:
@@ -967,16 +1097,11 @@ async def do_pick(request: Request, key: str):
     if draft.complete:
         raise HTTPException(status_code=403, detail="Can't draft: it's finished, friend.")
 
-    # key not in draft.picked
-    pl = POOL_MAPPING[key]
-    picks_per_pool = draft.picks_per_pool
-    player_pool_picks = 0
-    for pk in draft.draft:
-        if POOL_MAPPING[pk.key] == pl and pk.player == user.uuid:
-            player_pool_picks += 1
-            if player_pool_picks >= picks_per_pool or (room.config.open_qualifier_submission and player_pool_picks >= pl.oq_pick_count()):
-                raise HTTPException(
-                    status_code=403, detail=f"Player has already picked the maximum number of picks for pool {pl.name.full_name}")
+    # Same check /legal and random picks use; the key exists and is free, so
+    # all that's left is the pool limit
+    if not draft.can_pick(user.uuid, key, room.config.open_qualifier_submission):
+        raise HTTPException(
+            status_code=403, detail=f"Player has already picked the maximum number of picks for pool {POOL_MAPPING[key].name.full_name}")
 
     # Do the pick for this player.
     await draft.execute_pick(key, user.uuid, room)
@@ -0,0 +1,124 @@
+import json
+import time
+import zlib
+from functools import lru_cache
+
+from pydantic import BaseModel
+
+import metrics
+from utils import env_float
+from models.ws import Heartbeat, PlayerActionEnum, PlayerUpdate, RoomUpdate, RoomUpdateEnum, serialize
+
+
+# Sockets that opt in (/listen?compress=1) get text frames above this size as
+# a binary frame: one 0x03 byte followed by the zlib-compressed JSON.
+COMPRESSED_TYPE = 3
+COMPRESS_MIN = int(env_float("DRAAFT_WS_COMPRESS_MIN", 1024))
+COMPRESS_LEVEL = 6
+# Marks frames that were tried and didn't shrink enough to bother
+NOT_WORTH_IT = b""
+# Blanked for sockets following a room they aren't a member of
+SEED_KEYS = ("overworld_seed", "nether_seed", "end_seed")
+
+
+class Frame:
+    """
+    A message serialized once and shared by every recipient.
+
+    Broadcasts build one Frame and hand the same object to every socket queue,
+    so nothing is re-serialized per member / per socket. The UTF-8 bytes are
+    computed at most once too (for byte accounting, compression, ...).
+    Binary frames have no text, only data.
+    """
+
+    __slots__ = ("text", "_data", "_compressed", "_public", "coalesce")
+
+    def __init__(self, text: str | None, coalesce: tuple[str, float] | None = None):
+        self.text = text
+        self._data: bytes | None = None
+        self._compressed: bytes | None = None
+        self._public: Frame | None = None
+        # (key, window) if broadcasts of this message get debounced, see coalesce.py
+        self.coalesce = coalesce
+
+    @staticmethod
+    def binary(data: bytes) -> "Frame":
+        f = Frame(None)
+        f._data = data
+        return f
+
+    @property
+    def data(self) -> bytes:
+        if self._data is None:
+            assert self.text is not None
+            self._data = self.text.encode()
+        return self._data
+
+    def compressed(self) -> bytes | None:
+        # Compressed at most once, by whichever writer needs it first, and
+        # shared by every socket that negotiated compression
+        if self.text is None or len(self.text) < COMPRESS_MIN:
+            return None
+        if self._compressed is None:
+            started = time.perf_counter()
+            data = self.data
+            z = zlib.compress(data, COMPRESS_LEVEL)
+            metrics.observe("ws.compress_seconds", time.perf_counter() - started)
+            if len(z) < len(data) * 0.9:
+                # Only frames that actually go out compressed count towards the ratio
+                metrics.incr("ws.compress_bytes_in", len(data))
+                metrics.incr("ws.compress_bytes_out", len(z) + 1)
+                self._compressed = bytes([COMPRESSED_TYPE]) + z
+            else:
+                metrics.incr("ws.compress_skipped")
+                self._compressed = NOT_WORTH_IT
+        return self._compressed or None
+
+    def public(self) -> "Frame":
+        # Same message with the seeds blanked, for outsiders following the
+        # room. Most messages don't carry any and come back as they are.
+        if self.text is None or '_seed"' not in self.text:
+            return self
+        if self._public is None:
+            self._public = Frame(json.dumps(redact_seeds(json.loads(self.text)), separators=(",", ":")))
+        return self._public
+
+    def sequenced(self, seq: int) -> "Frame":
+        # Same message with "seq" spliced in front, no re-serialization
+        assert self.text is not None and self.text.startswith("{")
+        return Frame(f'{{"seq":{seq},{self.text[1:]}')
+
+    def tagged(self, code: str) -> "Frame":
+        # Same again with the room code, for sockets following several rooms
+        assert self.text is not None and self.text.startswith("{")
+        return Frame(f'{{"room":"{code}",{self.text[1:]}')
+
+    @staticmethod
+    def of(msg: "BaseModel | Frame") -> "Frame":
+        if isinstance(msg, Frame):
+            return msg
+        rule = getattr(msg, "coalesce", None)
+        return Frame(serialize(msg), rule() if rule is not None else None)
+
+
+def redact_seeds(value):
+    if isinstance(value, dict):
+        return {k: None if k in SEED_KEYS else redact_seeds(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [redact_seeds(v) for v in value]
+    return value
+
+
+# Payloads that never change, encoded once at import.
+ROOM_CLOSED = Frame.of(RoomUpdate(update=RoomUpdateEnum.closed))
+DRAFT_COMPLETE = Frame.of(RoomUpdate(update=RoomUpdateEnum.draft_complete))
+LOADING_COMPLETE = Frame.of(RoomUpdate(update=RoomUpdateEnum.loading_complete))
+ERROR_STATUS = Frame('{"status": "error"}')
+HEARTBEAT = Frame.of(Heartbeat(variant='<3 you matter'))
+
+
+@lru_cache(maxsize=4096)
+def player_update(uuid: str, action: PlayerActionEnum) -> Frame:
+    # joined / spectate / player updates for the same uuid repeat a lot
+    # (status swaps, every join replaying spectators)
+    return Frame.of(PlayerUpdate(uuid=uuid, action=action))
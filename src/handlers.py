@@ -1,22 +1,25 @@
-from fastapi import WebSocket
+from connection import Connection
 from db import PopulatedUser
+from frames import Frame
 
-from models.ws import NON_ADMIN_PLAYER_ACTIONS, ActionError, AdvancementUpdate, PositionUpload, PlayerAction, PlayerActionEnum, WebSocketMessage, serialize
+from models.ws import NON_ADMIN_PLAYER_ACTIONS, ActionError, AdvancementBatchUpdate, AdvancementUpdate, PositionUpload, PlayerAction, PlayerActionEnum, ClientMessage, Subscribe, Subscriptions, Unsubscribe
 from rooms import get_room_from_code, get_user_room_code
 from utils import LOG
 
 ## NOT USING ANY OF THIS CODE LOL
-async def handle_playeraction(websocket: WebSocket, msg: PlayerAction, user: PopulatedUser):
+async def handle_playeraction(conn: Connection, msg: PlayerAction, user: PopulatedUser):
+    # Replies go through the socket's queue like everything else, never
+    # straight to the websocket
     code = get_user_room_code(user.uuid)
     if code is None:
-        return await websocket.send_text(serialize(ActionError(text="could not find room code for user")))
+        return conn.send(Frame.of(ActionError(text="could not find room code for user")))
     room = get_room_from_code(code)
     if room is None:
         # Should never happen
-        return await websocket.send_text(serialize(ActionError(text="could not find room from code")))
+        return conn.send(Frame.of(ActionError(text="could not find room from code")))
 
     if msg.action not in NON_ADMIN_PLAYER_ACTIONS and user.uuid != room.admin:
-        return await websocket.send_text(serialize(ActionError(text=f"non-admin user cannot take action {msg.action}")))
+        return conn.send(Frame.of(ActionError(text=f"non-admin user cannot take action {msg.action}")))
 
     match msg.action:
         case PlayerActionEnum.kick:
@@ -29,32 +32,40 @@ async def handle_playeraction(websocket: WebSocket, msg: PlayerAction, user: Pop
             pass
 
 # yeah I'm using this code lol
-async def handle_advancement(msg: AdvancementUpdate, user: PopulatedUser):
-    from db_utils import into_gaming_player
+async def handle_advancement(msg: AdvancementUpdate | AdvancementBatchUpdate, user: PopulatedUser):
+    from db_utils import locked_gaming_player
+    advancements = msg.advancements if isinstance(msg, AdvancementBatchUpdate) else [msg.advancement]
+    async with locked_gaming_player(user) as res:
+        if res is None:
+            return
+        await _apply_advancements(advancements, user, *res)
+
+async def _apply_advancements(advancements: list[str], user: PopulatedUser, r, d):
+    # One save and one broadcast however many advancements came in
     from room_manager import mg
-    from models.ws import PlayerAdvancementUpdate
-    res = into_gaming_player(user)
-    if res is None:
-        return
-    r, d = res
+    from models.ws import PlayerAdvancementUpdate, vanilla_advancement
     uuid = user.uuid
 
     # the real advancement handling code
-    LOG('Handling advancement for:', r.code, 'of:', msg.advancement)
-
-    a = msg.as_vanilla_advancement()
-    if a is None:
-        LOG(f'Not an advancement: {a}')
-        return
+    LOG('Handling advancements for:', r.code, 'of:', advancements)
 
     if uuid not in r.state.player_advancements:
         r.state.player_advancements[uuid] = set()
-
     l = r.state.player_advancements[uuid]
-    if a in l:
-        return
 
-    l.add(a)
+    new = []
+    for adv in advancements:
+        a = vanilla_advancement(adv)
+        if a is None:
+            LOG(f'Not an advancement: {adv}')
+            continue
+        if a in l:
+            continue
+        l.add(a)
+        new.append(a)
+
+    if not new:
+        return
     import time
     r.state.latest_advancement = time.time()
 
@@ -67,27 +78,40 @@ async def handle_advancement(msg: AdvancementUpdate, user: PopulatedUser):
     # Save into the DB
     r.save_state()
     # Send the update to all players
-    await mg.broadcast_room(r, PlayerAdvancementUpdate(uuid=uuid, latest_advancement=a, count=len(l)))
+    await mg.broadcast_room(r, PlayerAdvancementUpdate(
+        uuid=uuid, latest_advancement=new[-1], count=len(l),
+        advancements=new if len(new) > 1 else None,
+    ))
 
 async def handle_position_update(msg: PositionUpload, user: PopulatedUser):
-    from db_utils import into_gaming_player
-    from room_manager import mg
-    from models.ws import PositionUpdate
-    res = into_gaming_player(user)
-    if res is None:
-        return
-    room, _ = res
-    uuid = user.uuid
-    await mg.broadcast_room(room, PositionUpdate(x=msg.x, y=msg.y, z=msg.z, dimension=msg.dimension, room_code=room.code, uuid=uuid))
-    
+    from positions import POSITIONS
+    # Just records the latest position, position_task sends them out in batches
+    POSITIONS.submit(user.uuid, msg.x, msg.y, msg.z, msg.dimension)
+
+def handle_binary_message(data: bytes, user: PopulatedUser):
+    from positions import POSITIONS
+    # Only binary message there is for now: packed position uploads
+    if not POSITIONS.submit_packed(user.uuid, data):
+        LOG('Bad binary websocket message from', user.uuid)
 
 
-async def handle_websocket_message(websocket: WebSocket, message: WebSocketMessage, user: PopulatedUser):
-    msg = message.message
+
+def handle_subscription(conn: Connection, msg: Subscribe | Unsubscribe):
+    from room_manager import mg
+    if isinstance(msg, Unsubscribe):
+        for code in msg.codes:
+            mg.unfollow(conn, code)
+    else:
+        failed = [code for code in msg.codes if not mg.follow(conn, code)]
+        if failed:
+            conn.send(Frame.of(ActionError(text=f"could not subscribe to {', '.join(failed)}")))
+    conn.send(Frame.of(Subscriptions(codes=sorted(conn.watching))))
+
+async def handle_websocket_message(conn: Connection, msg: ClientMessage, user: PopulatedUser):
     match msg:
         case PlayerAction():
-            await handle_playeraction(websocket, msg, user)
-        case AdvancementUpdate():
+            await handle_playeraction(conn, msg, user)
+        case AdvancementUpdate() | AdvancementBatchUpdate():
             await handle_advancement(msg, user)
         case PositionUpload():
             await handle_position_update(msg, user)
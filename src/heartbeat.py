@@ -0,0 +1,45 @@
+import asyncio
+import time
+
+import metrics
+from connection import CONNECTIONS
+from frames import HEARTBEAT
+from utils import LOG, env_float
+
+# Server driven keepalive for /listen sockets. Every PING_INTERVAL we send a
+# Heartbeat ('<3 you matter'); clients echo it back. A client that has echoed
+# at least once and then goes quiet for IDLE_TIMEOUT is treated as half-open
+# and dropped from every registry. Clients that never answer heartbeats (older
+# builds, and listeners that may legitimately never send anything) are
+# dropped once our pings stop getting out instead: the writer died on a send
+# error, or has been stuck on a send for IDLE_TIMEOUT. Either way the receive
+# loop of a half-open socket might never notice.
+PING_INTERVAL = env_float("DRAAFT_WS_PING_INTERVAL", 20)
+IDLE_TIMEOUT = env_float("DRAAFT_WS_IDLE_TIMEOUT", 60)
+
+
+def check_connections(now: float | None = None) -> int:
+    from room_manager import mg
+    now = time.monotonic() if now is None else now
+    reaped = 0
+    for conn in list(CONNECTIONS):
+        if (conn.heartbeats and now - conn.last_seen > IDLE_TIMEOUT) or conn.stalled(now, IDLE_TIMEOUT):
+            LOG("Dropping idle websocket for", conn.uuid)
+            mg.drop(conn)
+            reaped += 1
+            continue
+        conn.send(HEARTBEAT)
+    metrics.incr("ws.heartbeats_sent", len(CONNECTIONS))
+    if reaped:
+        metrics.incr("ws.idle_reaped", reaped)
+    return reaped
+
+
+async def heartbeat_task():
+    # One loop for every socket instead of a timer per connection
+    while True:
+        await asyncio.sleep(PING_INTERVAL)
+        try:
+            check_connections()
+        except Exception as e:
+            print(f"Warning: Heartbeat check failed: {e}")
@@ -0,0 +1,129 @@
+from enum import Enum
+from fastapi import APIRouter, Response
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+
+from models.runtime import RuntimeRoom
+from room_executor import EXECUTOR
+
+rt = APIRouter(prefix="/rooms")
+
+
+class RoomPhase(str, Enum):
+    open = "open"
+    drafting = "drafting"
+    playing = "playing"
+
+
+class RoomSummary(BaseModel):
+    code: str
+    admin: str
+    phase: RoomPhase
+    admin_owned: bool
+    oq: bool
+    live: bool
+    members: int
+    players: list[str]
+
+
+class RoomPage(BaseModel):
+    rooms: list[RoomSummary]
+    page: int
+    page_size: int
+    total: int
+
+
+def summarize(room: RuntimeRoom) -> RoomSummary:
+    if room.playing():
+        phase = RoomPhase.playing
+    elif room.drafting():
+        phase = RoomPhase.drafting
+    else:
+        phase = RoomPhase.open
+    return RoomSummary(
+        code=room.code,
+        admin=room.admin,
+        phase=phase,
+        admin_owned=room.admin_owned(),
+        oq=room.config["open_qualifier_submission"],
+        live=room.config["live_game"],
+        members=len(room.members),
+        players=room.draft.players if room.draft is not None else [],
+    )
+
+
+class RoomIndex:
+    """
+    In-memory index of rooms that still have members.
+
+    Mutations only mark a room dirty; dirty rooms are re-read (by code) the next
+    time someone asks for a page, and serialized pages are cached until then.
+    Polling an unchanged index costs a dict lookup.
+    """
+
+    def __init__(self):
+        self.entries: dict[str, RoomSummary] = dict()
+        self.dirty: set[str] = set()
+        self.pages: dict[tuple, bytes] = dict()
+
+    def invalidate(self, code: str):
+        self.dirty.add(code)
+
+    def load(self):
+        from db import sql
+        with sql as cur:
+            res = cur.execute("SELECT DISTINCT room_code FROM users WHERE room_code IS NOT NULL").fetchall()
+        self.dirty.update(r[0] for r in res)
+
+    def _refresh(self):
+        from rooms import get_runtime_room
+        if not self.dirty:
+            return
+        for code in self.dirty:
+            room = get_runtime_room(code)
+            if room is None or not room.members:
+                self.entries.pop(code, None)
+            else:
+                self.entries[code] = summarize(room)
+        self.dirty.clear()
+        self.pages.clear()
+
+    def page(self, phase: RoomPhase | None, admin_owned: bool | None, oq: bool | None,
+             live: bool | None, page: int, page_size: int) -> bytes:
+        from models.ws import serialize
+        self._refresh()
+        key = (phase, admin_owned, oq, live, page, page_size)
+        cached = self.pages.get(key)
+        if cached is not None:
+            return cached
+
+        matching = [
+            e for e in self.entries.values()
+            if (phase is None or e.phase == phase)
+            and (admin_owned is None or e.admin_owned == admin_owned)
+            and (oq is None or e.oq == oq)
+            and (live is None or e.live == live)
+        ]
+        matching.sort(key=lambda e: e.code)
+        start = page * page_size
+        res = serialize(RoomPage(rooms=matching[start:start + page_size], page=page, page_size=page_size, total=len(matching))).encode()
+        self.pages[key] = res
+        return res
+
+
+LOBBY = RoomIndex()
+EXECUTOR.add_listener(lambda room: LOBBY.invalidate(room.code))
+
+MAX_PAGE_SIZE = 100
+
+
+@rt.get("/active")
+async def get_active_rooms(phase: RoomPhase | None = None, admin_owned: bool | None = None,
+                           oq: bool | None = None, live: bool | None = None,
+                           page: int = 0, page_size: int = 25):
+    page = max(page, 0)
+    page_size = min(max(page_size, 1), MAX_PAGE_SIZE)
+    return Response(
+        LOBBY.page(phase, admin_owned, oq, live, page, page_size),
+        media_type=JSONResponse.media_type
+    )
@@ -0,0 +1,60 @@
+from collections import defaultdict
+from typing import Any, Callable
+
+# Tiny in-process metrics. Nothing fancy, it just needs to be cheap enough to
+# call from hot paths and readable from /admin/metrics.
+
+COUNTERS: defaultdict[str, int] = defaultdict(lambda: 0)
+GAUGES: dict[str, float] = dict()
+COLLECTORS: dict[str, Callable[[], Any]] = dict()
+
+
+class Timing:
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, value: float):
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def as_dict(self) -> dict[str, float]:
+        return {
+            "count": self.count,
+            "total": self.total,
+            "avg": self.total / self.count if self.count else 0.0,
+            "max": self.max,
+        }
+
+
+TIMINGS: defaultdict[str, Timing] = defaultdict(lambda: Timing())
+
+
+def incr(name: str, n: int = 1):
+    COUNTERS[name] += n
+
+
+def gauge(name: str, value: float):
+    GAUGES[name] = value
+
+
+def observe(name: str, value: float):
+    TIMINGS[name].add(value)
+
+
+def register_collector(name: str, fn: Callable[[], Any]):
+    # For state that is cheaper to compute on demand than to keep updated
+    # (e.g. per-room queue depths).
+    COLLECTORS[name] = fn
+
+
+def snapshot() -> dict[str, Any]:
+    return {
+        "counters": dict(COUNTERS),
+        "gauges": dict(GAUGES),
+        "timings": {k: v.as_dict() for k, v in TIMINGS.items()},
+        "collectors": {k: fn() for k, fn in COLLECTORS.items()},
+    }
@@ -177,10 +177,9 @@ class Room(BaseModel):
         return self.draft is not None and self.draft.complete
 
     def start_timer(self):
-        import asyncio
         if not self.config.enforce_timer or self.config.open_qualifier_submission:
             return
-        asyncio.create_task(pick_timer(self, 10))
+        arm_pick_timer(self, 10)
 
     def num_picks(self):
         if self.draft is not None:
@@ -188,17 +187,18 @@ class Room(BaseModel):
         return 0
 
     async def check_all_ready(self):
-        from room_manager import CLIENT_TO_WEBSOCKET, mg
+        from presence import PRESENCE
+        from room_manager import mg
         from models.ws import serialize
         from db import sql
-        from models.ws import RoomUpdate, RoomUpdateEnum
+        from frames import LOADING_COMPLETE
         from utils import LOG
         if self.draft is None or self.state.has_sent_start:
             return
         if not self.draft.complete:
             return
         for p in self.draft.players:
-            if p in CLIENT_TO_WEBSOCKET:
+            if PRESENCE.is_client(p):
                 if p not in self.state.ready_players:
                     # Is a client, is not ready
                     return
@@ -217,7 +217,7 @@ class Room(BaseModel):
 
         await mg.broadcast_room(
             self,
-            RoomUpdate(update=RoomUpdateEnum.loading_complete),
+            LOADING_COMPLETE,
         )
 
     async def set_ready(self, player: str, value: str):
@@ -244,7 +244,7 @@ class Room(BaseModel):
         self.state.start_draft(self)
 
         try:
-            draft = serialize(Draft.from_players(self.get_players()))
+            draft = Draft.from_players(self.get_players()).header()
             state = serialize(self.state)
             with sql as cur:
                 cur.execute(
@@ -290,32 +290,59 @@ class Room(BaseModel):
 
 
 PICK_TIMERS: dict[str, Task] = {}
+# Wall clock time each armed timer fires at, so we can re-arm after a restart
+PICK_DEADLINES: dict[str, float] = {}
 BUFFER_PICK: int = 1
-async def pick_timer(room: Room, extra_seconds: int = 0):
+def cancel_pick_timer(code: str):
     import asyncio
-    if room.code in PICK_TIMERS:
-        PICK_TIMERS[room.code].cancel()
-    cur_task = asyncio.current_task()
-    if cur_task is not None:
-        PICK_TIMERS[room.code] = cur_task
-    
-    # Now sleep! :)
-    await asyncio.sleep(int(room.config.pick_time) + extra_seconds + BUFFER_PICK)
+    t = PICK_TIMERS.pop(code, None)
+    PICK_DEADLINES.pop(code, None)
+    # The timer itself might be the one doing the pick - don't cancel ourselves
+    if t is not None and t is not asyncio.current_task():
+        t.cancel()
 
-    # now we pick!
-    new_room = room.updated()
-    if new_room is None:
-        return
-    if room.num_picks() != new_room.num_picks():
-        # nothing doing
-        return
 
-    if new_room.draft is None:
-        from utils import LOG
-        LOG(f"{new_room} has no draft?!")
-        return
-    
-    await new_room.draft.random_pick(new_room)
+def arm_pick_timer(room: Room, extra_seconds: int = 0):
+    schedule_pick_timer(room.code, int(room.config.pick_time) + extra_seconds + BUFFER_PICK, room.num_picks())
+
+
+def schedule_pick_timer(code: str, delay: float, picks: int):
+    import asyncio
+    import time
+    cancel_pick_timer(code)
+    PICK_DEADLINES[code] = time.time() + delay
+    PICK_TIMERS[code] = asyncio.create_task(pick_timer(code, delay, picks))
+
+
+async def pick_timer(code: str, delay: float, picks: int):
+    import asyncio
+    from fastapi import HTTPException
+    from room_executor import EXECUTOR
+    from utils import LOG
+
+    # Now sleep! :)
+    await asyncio.sleep(delay)
+
+    # Every pick cancels this task while holding the room lock, but that lock
+    # (and PICK_TIMERS) is per process. With several workers the pick may
+    # have happened elsewhere, so check against the stored pick count too.
+    async with EXECUTOR.mutate(code) as room:
+        if PICK_TIMERS.get(code) is asyncio.current_task():
+            cancel_pick_timer(code)
+        if room is None:
+            return
+        if room.draft is None:
+            LOG(f"{room} has no draft?!")
+            return
+        if room.num_picks() != picks:
+            LOG(f"Pick timer for {code} expected {picks} picks, found {room.num_picks()}")
+            return
+        # now we pick!
+        try:
+            await room.draft.random_pick(room)
+        except HTTPException as e:
+            # Another worker logged this pick index first
+            LOG(f"Pick timer for {code} lost its pick: {e.detail}")
 
 
 class RoomResult(RoomIdentifier):
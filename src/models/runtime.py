@@ -0,0 +1,220 @@
+import json
+from array import array
+from sys import intern
+from typing import Any, Iterable
+
+from pydantic_core import from_json
+
+from models.room import ADMINS, Room, RoomConfig, RoomState
+from draft import Draft, replay_draft
+
+"""
+Hot-path runtime representation of rooms.
+
+Room / RoomState / Draft are pydantic models, which makes them nice at the API
+boundary but expensive to build on every lookup and to copy around. These are
+plain __slots__ classes built straight from the stored JSON: advancements and
+draftable keys are interned strings, and picks are two small arrays instead of
+a list of DraftPick models. Convert with to_model() only when something needs
+to hand the room to pydantic / FastAPI.
+"""
+
+# Draftable keys -> small ints so picks fit in an array('H'). Grows if a stored
+# draft references a key we don't know about (e.g. a removed draftable).
+KEY_TABLE: list[str] = []
+KEY_IDS: dict[str, int] = {}
+
+
+def key_id(key: str) -> int:
+    i = KEY_IDS.get(key)
+    if i is None:
+        i = KEY_IDS[key] = len(KEY_TABLE)
+        KEY_TABLE.append(intern(key))
+    return i
+
+
+CONFIG_DEFAULTS: dict[str, Any] = RoomConfig().model_dump(mode="json")
+
+
+class RuntimeState:
+    __slots__ = (
+        "overworld_seed", "nether_seed", "end_seed",
+        "player_advancements", "hit_80_at", "ready_players",
+        "has_sent_start", "start_sent_at", "latest_advancement", "high_quality_seed",
+    )
+
+    def __init__(self, d: dict):
+        self.overworld_seed: str | None = d.get("overworld_seed")
+        self.nether_seed: str | None = d.get("nether_seed")
+        self.end_seed: str | None = d.get("end_seed")
+        self.player_advancements: dict[str, set[str]] = {
+            k: set(map(intern, v)) for k, v in d.get("player_advancements", {}).items()
+        }
+        self.hit_80_at: dict[str, float] = d.get("hit_80_at", {})
+        self.ready_players: set[str] = set(d.get("ready_players", ()))
+        self.has_sent_start: bool = d.get("has_sent_start", False)
+        self.start_sent_at: float | None = d.get("start_sent_at")
+        self.latest_advancement: float | None = d.get("latest_advancement")
+        self.high_quality_seed: bool | None = d.get("high_quality_seed")
+
+    @staticmethod
+    def from_json(js: str | None) -> "RuntimeState":
+        return RuntimeState(from_json(js, cache_strings="all") if js else {})
+
+    def as_dict(self, redact_seeds: bool = False) -> dict:
+        return {
+            "overworld_seed": None if redact_seeds else self.overworld_seed,
+            "nether_seed": None if redact_seeds else self.nether_seed,
+            "end_seed": None if redact_seeds else self.end_seed,
+            "player_advancements": {k: list(v) for k, v in self.player_advancements.items()},
+            "hit_80_at": self.hit_80_at,
+            "ready_players": list(self.ready_players),
+            "has_sent_start": self.has_sent_start,
+            "start_sent_at": self.start_sent_at,
+            "latest_advancement": self.latest_advancement,
+            "high_quality_seed": self.high_quality_seed,
+        }
+
+    def to_model(self) -> RoomState:
+        return RoomState(**self.as_dict())
+
+
+class RuntimeDraft:
+    __slots__ = (
+        "players", "skip_players", "pick_keys", "pick_players", "position",
+        "next_positions", "picked", "complete", "sent_complete", "gambits",
+        "max_picks", "picks_per_pool",
+    )
+
+    def __init__(self, d: dict):
+        self.players: list[str] = d.get("players", [])
+        self.skip_players: set[str] = set(d.get("skip_players", ()))
+        # pick i was draftable KEY_TABLE[pick_keys[i]] by players[pick_players[i]]
+        picks = d.get("draft", ())
+        ids = KEY_IDS
+        self.pick_keys = array("H", [ids.get(p["key"]) or key_id(p["key"]) for p in picks])
+        pids = {u: i for i, u in enumerate(self.players)}
+        self.pick_players = array("B", [pids.get(p["player"]) if p["player"] in pids else self._player_id(p["player"], pids) for p in picks])
+        self.position: list[str] = d.get("position", [])
+        self.next_positions: list[str] = d.get("next_positions", [])
+        self.picked: set[str] = set(map(intern, d.get("picked", ())))
+        self.complete: bool = d.get("complete", False)
+        self.sent_complete: bool = d.get("sent_complete", False)
+        self.gambits: dict[str, set[str]] = {k: set(map(intern, v)) for k, v in d.get("gambits", {}).items()}
+        self.max_picks: int = d["max_picks"]
+        self.picks_per_pool: int = d["picks_per_pool"]
+
+    def _player_id(self, uuid: str, pids: dict[str, int]) -> int:
+        # Shouldn't happen, but keep the pick rather than lose it
+        self.players.append(uuid)
+        pids[uuid] = len(self.players) - 1
+        return pids[uuid]
+
+    @staticmethod
+    def from_log(header: str | None, picks: Iterable[tuple[str, str]] = ()) -> "RuntimeDraft | None":
+        # Stored header + pick log, see replay_draft
+        if not header:
+            return None
+        try:
+            return RuntimeDraft(replay_draft(from_json(header, cache_strings="all"), picks))
+        except (KeyError, ValueError, OverflowError):
+            return None
+
+    def num_picks(self) -> int:
+        return len(self.pick_keys)
+
+    def picks(self):
+        for i, (k, p) in enumerate(zip(self.pick_keys, self.pick_players)):
+            yield (KEY_TABLE[k], self.players[p], i)
+
+    def as_dict(self) -> dict:
+        return {
+            "players": self.players,
+            "skip_players": list(self.skip_players),
+            "draft": [{"key": k, "player": p, "index": i} for k, p, i in self.picks()],
+            "position": self.position,
+            "next_positions": self.next_positions,
+            "picked": list(self.picked),
+            "complete": self.complete,
+            "sent_complete": self.sent_complete,
+            "gambits": {k: list(v) for k, v in self.gambits.items()},
+            "max_picks": self.max_picks,
+            "picks_per_pool": self.picks_per_pool,
+        }
+
+    def to_model(self) -> Draft:
+        return Draft(**self.as_dict())
+
+
+class RuntimeRoom:
+    __slots__ = ("code", "members", "admin", "config", "draft", "state")
+
+    def __init__(self, code: str, members: set[str], admin: str, config: dict,
+                 draft: RuntimeDraft | None, state: RuntimeState):
+        self.code = code
+        self.members = members
+        self.admin = admin
+        # Config stays a plain dict (defaults filled in), it's tiny and rarely read
+        self.config = config
+        self.draft = draft
+        self.state = state
+
+    @staticmethod
+    def from_row(row: tuple, members: set[str], picks: Iterable[tuple[str, str]] = ()) -> "RuntimeRoom":
+        # rooms row: id, code, admin, config, draft (header), state
+        try:
+            config = {**CONFIG_DEFAULTS, **from_json(row[3] or "{}")}
+        except ValueError:
+            config = dict(CONFIG_DEFAULTS)
+        return RuntimeRoom(
+            code=str(row[1]),
+            members=members,
+            admin=row[2],
+            config=config,
+            draft=RuntimeDraft.from_log(row[4], picks),
+            state=RuntimeState.from_json(row[5]),
+        )
+
+    @staticmethod
+    def from_model(room: Room) -> "RuntimeRoom":
+        from models.ws import serialize
+        return RuntimeRoom(
+            code=room.code,
+            members=set(room.members),
+            admin=room.admin,
+            config=room.config.model_dump(mode="json"),
+            draft=RuntimeDraft(json.loads(serialize(room.draft))) if room.draft is not None else None,
+            state=RuntimeState(json.loads(serialize(room.state))),
+        )
+
+    def admin_owned(self) -> bool:
+        return self.admin in ADMINS
+
+    def drafting(self) -> bool:
+        return self.draft is not None and not self.draft.complete
+
+    def playing(self) -> bool:
+        return self.draft is not None and self.draft.complete
+
+    def as_dict(self, redact_seeds: bool = False) -> dict:
+        return {
+            "code": self.code,
+            "members": list(self.members),
+            "admin": self.admin,
+            "config": self.config,
+            "draft": self.draft.as_dict() if self.draft is not None else None,
+            "state": self.state.as_dict(redact_seeds),
+        }
+
+    def to_json(self, redact_seeds: bool = False) -> str:
+        return json.dumps(self.as_dict(redact_seeds), separators=(",", ":"))
+
+    def to_model(self) -> Room:
+        return Room(
+            code=self.code,
+            members=self.members,
+            admin=self.admin,
+            config=RoomConfig(**self.config),
+            draft=self.draft.to_model() if self.draft is not None else None,
+            state=self.state.to_model(),
+        )
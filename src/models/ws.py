@@ -1,9 +1,9 @@
-from pydantic import BaseModel, Field, ValidationError
-from typing import Literal, TypeVar, Union, Type
+from pydantic import BaseModel, Field, TypeAdapter, ValidationError
+from typing import Annotated, Any, Literal, TypeVar, Union, Type
 from enum import Enum
 from re import compile
 
-from models.room import RoomConfig
+from models.room import Room, RoomConfig
 
 """
 Client -> Server:
@@ -39,11 +39,33 @@ class PlayerAction(BaseModel):
     uuid: str
     action: PlayerActionEnum
 
+# Follow / stop following rooms other than your own on this socket
+class Subscribe(BaseModel):
+    variant: Literal['subscribe']
+    codes: list[str] = Field(max_length=64)
+
+class Unsubscribe(BaseModel):
+    variant: Literal['unsubscribe']
+    codes: list[str] = Field(max_length=64)
+
+# Debounce windows (seconds) for broadcasts that churn. A model opts in with
+# coalesce() -> (key, window); only the latest message per key and room within
+# the window gets sent. See coalesce.py.
+CONFIG_WINDOW = 1.0
+STATUS_WINDOW = 0.5
+ADVANCEMENT_WINDOW = 0.25
+
 class PlayerUpdate(BaseModel):
     variant: Literal['playerupdate'] = 'playerupdate'
     uuid: str
     action: PlayerActionEnum
 
+    def coalesce(self) -> tuple[str, float] | None:
+        # Status swaps only, joins / leaves / kicks go out right away
+        if self.action in (PlayerActionEnum.spectate, PlayerActionEnum.player):
+            return (f'status:{self.uuid}', STATUS_WINDOW)
+        return None
+
 class RoomUpdateEnum(str, Enum):
     closed = 'closed'
     config = 'config'
@@ -60,11 +82,72 @@ class RoomUpdate(BaseModel):
     update: RoomUpdateEnum
     config: RoomConfig | None = None
 
+    def coalesce(self) -> tuple[str, float] | None:
+        if self.update == RoomUpdateEnum.config:
+            return ('config', CONFIG_WINDOW)
+        return None
+
 class RoomStatus(BaseModel):
     variant: Literal['roomdata'] = 'roomdata'
     players: list[str] # list of player usernames
     admin: str # username of admin player
 
+# Sent instead of a replay when a reconnecting client missed too much
+class RoomResync(BaseModel):
+    variant: Literal['resync'] = 'resync'
+    seq: int
+    room: Room
+
+class MemberSnapshot(BaseModel):
+    uuid: str
+    status: str # player / spectate
+    ready: bool
+    advancements: int
+
+# Everything a freshly connected client needs about its room, in one frame
+class RoomSnapshot(BaseModel):
+    variant: Literal['roomsnapshot'] = 'roomsnapshot'
+    seq: int
+    code: str
+    admin: str
+    members: list[MemberSnapshot]
+    drafting: bool
+    playing: bool
+    position: list[str] | None = None # whose pick it is, while drafting
+
+# What spectators get every so often instead of every single event
+class SpectatorSnapshot(BaseModel):
+    variant: Literal['spectatorsnapshot'] = 'spectatorsnapshot'
+    seq: int
+    room: Room
+
+# JSON patch (RFC 6902) taking a room from version `base` to `version`
+class RoomPatch(BaseModel):
+    variant: Literal['roompatch'] = 'roompatch'
+    base: int
+    version: int
+    ops: list[dict[str, Any]]
+
+# /room?since=: the ops since that version, or the whole room if it's too old
+class RoomDelta(BaseModel):
+    variant: Literal['roomdelta'] = 'roomdelta'
+    version: int
+    base: int | None = None
+    ops: list[dict[str, Any]] | None = None
+    room: Room | None = None
+
+# A member's sockets came / went, or their game client (un)registered
+class PresenceUpdate(BaseModel):
+    variant: Literal['presence'] = 'presence'
+    uuid: str
+    online: bool
+    client: bool
+
+# Rooms a socket follows besides its own, after every (un)subscribe
+class Subscriptions(BaseModel):
+    variant: Literal['subscriptions'] = 'subscriptions'
+    codes: list[str]
+
 class ActionError(BaseModel):
     variant: Literal['error'] = 'error'
     text: str
@@ -75,20 +158,44 @@ class AdvancementUpdate(BaseModel):
     advancement: str
 
     def as_vanilla_advancement(self) -> None | str:
-        from re import match
-        mo = match(ADVANCEMENT_REGEX, self.advancement)
-        if mo is None:
-            return None
-        o = mo.group(1)
-        if o.startswith('recipe'):
-            return None
-        return o
+        return vanilla_advancement(self.advancement)
+
+def vanilla_advancement(advancement: str) -> None | str:
+    mo = ADVANCEMENT_REGEX.match(advancement)
+    if mo is None:
+        return None
+    o = mo.group(1)
+    if o.startswith('recipe'):
+        return None
+    return o
+
+# Many advancements at once, e.g. everything the mod has on world load / reconnect
+class AdvancementBatchUpdate(BaseModel):
+    variant: Literal['AdvancementBatchUpdate'] = 'AdvancementBatchUpdate'
+    advancements: list[str] = Field(max_length=2048)
 
 class PlayerAdvancementUpdate(BaseModel):
     variant: Literal['PlayerAdvancementUpdate'] = 'PlayerAdvancementUpdate'
     uuid: str # the player that this update is for
     latest_advancement: str # the advancement that caused this update
     count: int # total advancement count
+    advancements: list[str] | None = None # every new advancement, if there was more than one
+
+    def coalesce(self) -> tuple[str, float] | None:
+        return (f'advancements:{self.uuid}', ADVANCEMENT_WINDOW)
+
+    def merge(self, earlier: 'PlayerAdvancementUpdate') -> 'PlayerAdvancementUpdate':
+        # count is cumulative, but clients show every advancement, so the
+        # pending ones get carried over instead of replaced
+        advancements = list(earlier.advancements or [earlier.latest_advancement])
+        for a in self.advancements or [self.latest_advancement]:
+            if a not in advancements:
+                advancements.append(a)
+        return PlayerAdvancementUpdate(
+            uuid=self.uuid, latest_advancement=self.latest_advancement,
+            count=max(self.count, earlier.count),
+            advancements=advancements if len(advancements) > 1 else None,
+        )
 
 class PositionUpload(BaseModel):
     variant: Literal['PositionUpload'] = 'PositionUpload'
@@ -106,18 +213,57 @@ class PositionUpdate(BaseModel):
     z: float
     dimension: str
     
+class PlayerPosition(BaseModel):
+    uuid: str
+    x: float
+    y: float
+    z: float
+    dimension: str
+
+# Latest known position of every player that moved since the last tick
+class PositionBatchUpdate(BaseModel):
+    variant: Literal['PositionBatchUpdate'] = 'PositionBatchUpdate'
+    room_code: str
+    positions: list[PlayerPosition]
+
 # Received by the server, so RoomStatus is not valid (we only send those)
+ClientMessage = Annotated[Union[Heartbeat, RoomAction, PlayerAction, Subscribe, Unsubscribe, AdvancementUpdate, AdvancementBatchUpdate, PositionUpload], Field(discriminator='variant')]
+CLIENT_MESSAGE = TypeAdapter(ClientMessage)
+# Positions and advancements are nearly all of the traffic, so they skip the
+# union and get validated by their own adapters when the variant sniff matches.
+FAST_PATHS: list[tuple[str, TypeAdapter]] = [
+    ('"PositionUpload"', TypeAdapter(PositionUpload)),
+    ('"AdvancementUpdate"', TypeAdapter(AdvancementUpdate)),
+    ('"AdvancementBatchUpdate"', TypeAdapter(AdvancementBatchUpdate)),
+]
+
 class WebSocketMessage(BaseModel):
-    message: Union[Heartbeat, RoomAction, PlayerAction, AdvancementUpdate, PositionUpload] = Field(discriminator='variant')
+    message: ClientMessage
 
     @staticmethod
-    def deserialize(data: str) -> 'WebSocketMessage | None':
-        import json
-        try:
-            # Ignore the type check error here lol, it works
-            return WebSocketMessage(message=json.loads(data))
-        except Exception as e:
-            print(f'Warning: Got a bad deserialize: {e}')
+    def deserialize(data: str | bytes) -> 'WebSocketMessage | None':
+        msg = decode_message(data)
+        return WebSocketMessage.model_construct(message=msg) if msg is not None else None
+
+def decode_message(data: str | bytes) -> ClientMessage | None:
+    # What /listen uses, skips building the WebSocketMessage wrapper
+    try:
+        return decode(data)
+    except ValidationError as e:
+        print(f'Warning: Got a bad deserialize: {e}')
+
+def decode(data: str | bytes) -> ClientMessage:
+    # validate_json parses straight into the model, no json.loads dict in between
+    probe = data if isinstance(data, str) else data.decode(errors='replace')
+    for needle, adapter in FAST_PATHS:
+        if needle in probe:
+            try:
+                return adapter.validate_json(data)
+            except ValidationError:
+                # The sniff can be fooled (e.g. the string shows up in another
+                # field), in which case the variant literal won't validate
+                break
+    return CLIENT_MESSAGE.validate_json(data)
 
 def serialize(rs: BaseModel):
     return rs.model_dump_json()
@@ -0,0 +1,168 @@
+import asyncio
+import struct
+import time
+
+import metrics
+from frames import Frame
+from models.room import Room
+from models.ws import PlayerPosition, PositionBatchUpdate
+from room_executor import EXECUTOR
+from utils import env_float
+
+# Positions are the chattiest thing we carry. Uploads only overwrite the
+# player's latest position; once per tick every room with movement gets one
+# batched frame, however fast clients upload.
+POSITION_TICK = env_float("DRAAFT_POSITION_TICK", 0.25)
+# How long we trust a cached uuid -> room resolution
+ROUTE_TTL = env_float("DRAAFT_POSITION_ROUTE_TTL", 5)
+
+# Opt-in binary encoding, negotiated per socket as a websocket subprotocol.
+# Sockets that don't ask for it keep getting PositionBatchUpdate JSON.
+# Little endian, coordinates are float32 (plenty for a map marker):
+#   upload (client -> server): u8 type=1, f32 x, f32 y, f32 z, u8 dimension
+#   batch  (server -> client): u8 type=2, u8 count, then count times:
+#       u8 player (index into draft.players), u8 dimension, f32 x, f32 y, f32 z
+BINARY_SUBPROTOCOL = "draaft.positions.v1"
+UPLOAD_TYPE = 1
+BATCH_TYPE = 2
+UPLOAD = struct.Struct("<BfffB")
+BATCH_HEADER = struct.Struct("<BB")
+BATCH_ENTRY = struct.Struct("<BBfff")
+
+DIMENSIONS = ("overworld", "the_nether", "the_end")
+DIMENSION_IDS = {d: i for i, d in enumerate(DIMENSIONS)} | {f"minecraft:{d}": i for i, d in enumerate(DIMENSIONS)}
+UNKNOWN_DIMENSION = 255
+MAX_COORD = 1e9
+
+
+class PositionRoute:
+    __slots__ = ("code", "members", "index", "expires")
+
+    def __init__(self, code: str | None, members: frozenset[str], index: int, expires: float):
+        self.code = code
+        self.members = members
+        # Player index in draft.players, what binary frames use instead of uuids
+        self.index = index
+        self.expires = expires
+
+
+class PositionAggregator:
+    def __init__(self):
+        # room code -> uuid -> latest (x, y, z, dimension)
+        self.pending: dict[str, dict[str, tuple[float, float, float, str]]] = dict()
+        self.routes: dict[str, PositionRoute] = dict()
+
+    def route(self, uuid: str) -> PositionRoute:
+        # Same rules as into_gaming_player, but cached so that uploads don't
+        # cost two queries and a room deserialization each.
+        from rooms import get_runtime_room, get_user_room_code
+        now = time.monotonic()
+        r = self.routes.get(uuid)
+        if r is not None and r.expires > now:
+            return r
+
+        code = get_user_room_code(uuid)
+        room = get_runtime_room(code) if code is not None else None
+        if room is None or room.draft is None or uuid not in room.draft.players or not room.draft.complete:
+            r = PositionRoute(None, frozenset(), 0, now + ROUTE_TTL)
+        else:
+            r = PositionRoute(room.code, frozenset(room.members), room.draft.players.index(uuid), now + ROUTE_TTL)
+        self.routes[uuid] = r
+        return r
+
+    def submit(self, uuid: str, x: float, y: float, z: float, dimension: str):
+        metrics.incr("positions.received")
+        if not (abs(x) < MAX_COORD and abs(y) < MAX_COORD and abs(z) < MAX_COORD):
+            # nan / inf / nonsense, and keeps float32 packing from overflowing
+            return
+        r = self.route(uuid)
+        if r.code is None:
+            return
+        room = self.pending.setdefault(r.code, dict())
+        if uuid in room:
+            metrics.incr("positions.coalesced")
+        room[uuid] = (x, y, z, dimension)
+
+    def submit_packed(self, uuid: str, data: bytes) -> bool:
+        if len(data) != UPLOAD.size:
+            return False
+        kind, x, y, z, dim = UPLOAD.unpack(data)
+        if kind != UPLOAD_TYPE or dim >= len(DIMENSIONS):
+            return False
+        metrics.incr("positions.received_binary")
+        self.submit(uuid, x, y, z, DIMENSIONS[dim])
+        return True
+
+    def flush(self):
+        from bus import BUS
+        if not self.pending:
+            return
+        pending, self.pending = self.pending, dict()
+        for code, positions in pending.items():
+            routes = self._routes(code, positions)
+            if not routes:
+                continue
+            if len(routes) != len(positions):
+                positions = {u: positions[u] for u in routes}
+            members = next(iter(routes.values())).members
+            BUS.publish(code, members, json_batch(code, positions), binary_batch(positions, routes), sequenced=False)
+            metrics.incr("positions.frames")
+
+    def _routes(self, code: str, positions: dict) -> dict[str, PositionRoute]:
+        # Routes can be forgotten between submit and flush (room mutated);
+        # players whose route is gone just skip this tick.
+        res = dict()
+        for uuid in positions:
+            r = self.routes.get(uuid)
+            if r is not None and r.code == code:
+                res[uuid] = r
+        return res
+
+    def forget(self, room: Room):
+        # Joins / leaves / completion all go through the executor, so the
+        # cached routes never outlive a membership change.
+        for m in room.members:
+            self.routes.pop(m, None)
+        for uuid in self.pending.get(room.code, ()):
+            self.routes.pop(uuid, None)
+
+    def prune(self):
+        now = time.monotonic()
+        self.routes = {k: v for k, v in self.routes.items() if v.expires > now}
+
+    def stats(self) -> dict:
+        return {
+            "routes": len(self.routes),
+            "pending_rooms": len(self.pending),
+            "pending_positions": sum(len(p) for p in self.pending.values()),
+        }
+
+
+def json_batch(code: str, positions: dict[str, tuple[float, float, float, str]]) -> Frame:
+    return Frame.of(PositionBatchUpdate(room_code=code, positions=[
+        PlayerPosition(uuid=uuid, x=x, y=y, z=z, dimension=dim) for uuid, (x, y, z, dim) in positions.items()
+    ]))
+
+
+def binary_batch(positions: dict[str, tuple[float, float, float, str]], routes: dict[str, PositionRoute]) -> Frame:
+    buf = bytearray(BATCH_HEADER.pack(BATCH_TYPE, len(routes)))
+    for uuid, r in routes.items():
+        x, y, z, dim = positions[uuid]
+        buf += BATCH_ENTRY.pack(r.index, DIMENSION_IDS.get(dim, UNKNOWN_DIMENSION), x, y, z)
+    return Frame.binary(bytes(buf))
+
+
+POSITIONS = PositionAggregator()
+EXECUTOR.add_listener(POSITIONS.forget)
+metrics.register_collector("positions", POSITIONS.stats)
+
+
+async def position_task():
+    while True:
+        await asyncio.sleep(POSITION_TICK)
+        try:
+            POSITIONS.flush()
+            if len(POSITIONS.routes) > 1024:
+                POSITIONS.prune()
+        except Exception as e:
+            print(f"Warning: Position flush failed: {e}")
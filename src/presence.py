@@ -0,0 +1,160 @@
+import time
+from typing import Callable
+
+import metrics
+from connection import Connection
+from utils import env_float
+
+# Sane maximum of /listen sockets per user
+MAX_CONNECTIONS = int(env_float("DRAAFT_MAX_CONNECTIONS", 10))
+
+
+class Presence:
+    """
+    Who is connected right now: open sockets per user, which users are online
+    in each room, and which users are registered game clients.
+
+    Everything is keyed on the Connection itself rather than counted, so
+    connect / disconnect are idempotent and a socket can't be counted twice
+    or leak a count however it goes away. Entries are dropped once empty.
+    """
+
+    def __init__(self):
+        self.users: dict[str, set[Connection]] = dict()
+        # code -> uuid -> that user's sockets which are members of the room
+        self.rooms: dict[str, dict[str, set[Connection]]] = dict()
+        # The one socket per user that registered as the game client
+        self.clients: dict[str, Connection] = dict()
+        # Clients that were registered before a restart -> when we stop waiting
+        # for them to come back. Until then they still count as clients.
+        self.restored: dict[str, float] = dict()
+        # Called with (code, uuid) when a user comes online / goes offline in a
+        # room, or registers / drops their client while in one
+        self.listeners: list[Callable[[str, str], None]] = list()
+
+    def add_listener(self, fn: Callable[[str, str], None]):
+        self.listeners.append(fn)
+
+    def _changed(self, code: str | None, uuid: str):
+        if code is None:
+            return
+        metrics.incr("presence.events")
+        for fn in self.listeners:
+            try:
+                fn(code, uuid)
+            except Exception as e:
+                print(f"Warning: Presence listener failed: {e}")
+
+    def connections(self, uuid: str) -> int:
+        return len(self.users.get(uuid, ()))
+
+    def sockets(self, uuid: str) -> set[Connection]:
+        return self.users.get(uuid, set())
+
+    def connected(self, uuid: str) -> bool:
+        return uuid in self.users
+
+    def online(self, code: str, uuid: str) -> bool:
+        return uuid in self.rooms.get(code, {})
+
+    def online_in(self, code: str) -> set[str]:
+        return set(self.rooms.get(code, {}))
+
+    def is_client(self, uuid: str) -> bool:
+        if uuid in self.clients:
+            return True
+        return self.restored.get(uuid, 0) > time.time()
+
+    def connect(self, conn: Connection):
+        self.users.setdefault(conn.uuid, set()).add(conn)
+
+    def disconnect(self, conn: Connection) -> bool:
+        # Returns whether the connection was still counted
+        self.unregister_client(conn)
+        if conn.room is not None:
+            self.exit(conn, conn.room)
+        conns = self.users.get(conn.uuid)
+        if conns is None or conn not in conns:
+            return False
+        conns.remove(conn)
+        if not conns:
+            del self.users[conn.uuid]
+        return True
+
+    def enter(self, conn: Connection, code: str):
+        members = self.rooms.setdefault(code, dict())
+        conns = members.get(conn.uuid)
+        if conns is None:
+            conns = members[conn.uuid] = set()
+        first = not conns
+        conns.add(conn)
+        if first:
+            self._changed(code, conn.uuid)
+
+    def exit(self, conn: Connection, code: str):
+        members = self.rooms.get(code)
+        if members is None:
+            return
+        conns = members.get(conn.uuid)
+        if conns is None or conn not in conns:
+            return
+        conns.remove(conn)
+        if conns:
+            return
+        del members[conn.uuid]
+        if not members:
+            del self.rooms[code]
+        self._changed(code, conn.uuid)
+
+    def forget_room(self, code: str):
+        # Room is gone, nobody left to tell
+        self.rooms.pop(code, None)
+
+    def register_client(self, conn: Connection) -> bool:
+        current = self.clients.get(conn.uuid)
+        if current is not None:
+            return current is conn
+        self.clients[conn.uuid] = conn
+        self.restored.pop(conn.uuid, None)
+        self._changed(conn.room, conn.uuid)
+        return True
+
+    def unregister_client(self, conn: Connection):
+        if self.clients.get(conn.uuid) is not conn:
+            return
+        del self.clients[conn.uuid]
+        self._changed(conn.room, conn.uuid)
+
+    def restore_clients(self, uuids: list[str], until: float):
+        for uuid in uuids:
+            if uuid not in self.clients:
+                self.restored[uuid] = until
+
+    def prune(self, now: float | None = None):
+        now = time.time() if now is None else now
+        for uuid in [u for u, t in self.restored.items() if t <= now]:
+            del self.restored[uuid]
+
+    def stats(self) -> dict:
+        return {
+            "users": len(self.users),
+            "rooms": len(self.rooms),
+            "clients": len(self.clients),
+            "restored_clients": len(self.restored),
+        }
+
+
+PRESENCE = Presence()
+metrics.register_collector("presence", PRESENCE.stats)
+
+
+def broadcast_presence(code: str, uuid: str):
+    # Presence is transient, so it skips the replay log
+    from bus import BUS
+    from frames import Frame
+    from models.ws import PresenceUpdate
+    msg = PresenceUpdate(uuid=uuid, online=PRESENCE.online(code, uuid), client=PRESENCE.is_client(uuid))
+    BUS.publish(code, [], Frame.of(msg), sequenced=False)
+
+
+PRESENCE.add_listener(broadcast_presence)
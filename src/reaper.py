@@ -0,0 +1,114 @@
+import asyncio
+import time
+
+import metrics
+from utils import env_float
+
+# A room is reclaimed once none of its members has had a socket open and
+# nothing has mutated it for this long.
+ROOM_TTL = env_float("DRAAFT_ROOM_TTL", 3 * 60 * 60)
+REAP_INTERVAL = env_float("DRAAFT_REAP_INTERVAL", 5 * 60)
+
+# We can't know how long a room was idle before this process started, so
+# every room gets a full TTL from boot.
+STARTED_AT = time.time()
+# Last time the reaper saw a connected socket in each room
+LAST_CONNECTED: dict[str, float] = dict()
+
+
+def _last_active(code: str, state) -> float:
+    from room_executor import EXECUTOR
+    return max(
+        STARTED_AT,
+        LAST_CONNECTED.get(code, 0),
+        EXECUTOR.last_activity.get(code, 0),
+        (state.latest_advancement if state is not None else None) or 0,
+    )
+
+
+def reap_abandoned_rooms(now: float | None = None) -> int:
+    """
+    Closes rooms with no connected sockets and no activity past ROOM_TTL,
+    clearing every dangling users.room_code in one update. Returns the number
+    of rooms reclaimed.
+    """
+    from db import sql
+    from models.room import cancel_pick_timer
+    from models.runtime import RuntimeState
+    from lobby import LOBBY
+    from room_executor import EXECUTOR
+    from presence import PRESENCE
+    from room_manager import mg
+
+    if now is None:
+        now = time.time()
+    PRESENCE.prune(now)
+
+    # Note: nothing in here awaits, so no mutation can sneak in between the
+    # checks and the updates. Rooms mid-mutation show up as busy and are skipped.
+    with sql as cur:
+        memberships = cur.execute("SELECT uuid, room_code FROM users WHERE room_code IS NOT NULL").fetchall()
+
+    members: dict[str, list[str]] = dict()
+    for uuid, code in memberships:
+        members.setdefault(code, list()).append(uuid)
+
+    candidates = list()
+    for code, uuids in members.items():
+        if any(PRESENCE.connected(u) for u in uuids):
+            LAST_CONNECTED[code] = now
+            continue
+        if EXECUTOR.busy(code):
+            continue
+        candidates.append(code)
+
+    if not candidates:
+        return 0
+
+    fmt = ",".join("?" * len(candidates))
+    with sql as cur:
+        states = dict(cur.execute(f"SELECT code, state FROM rooms WHERE code IN ({fmt})", candidates).fetchall())
+
+    reclaimed = list()
+    deleted = list()
+    for code in candidates:
+        state = RuntimeState.from_json(states[code]) if code in states else None
+        if now - _last_active(code, state) < ROOM_TTL:
+            continue
+        reclaimed.append(code)
+        # Same rule as destroy_room: once start is sent the room is history
+        if state is None or not state.has_sent_start:
+            deleted.append(code)
+
+    if not reclaimed:
+        return 0
+
+    rfmt = ",".join("?" * len(reclaimed))
+    dfmt = ",".join("?" * len(deleted))
+    with sql as cur:
+        cur.execute(f"UPDATE users SET room_code = NULL WHERE room_code IN ({rfmt})", reclaimed)
+        cur.execute(f"DELETE FROM rooms WHERE code IN ({dfmt})", deleted)
+        cur.execute(f"DELETE FROM picks WHERE room IN ({dfmt})", deleted)
+
+    for code in reclaimed:
+        cancel_pick_timer(code)
+        LOBBY.invalidate(code)
+        mg.forget_room(code)
+        EXECUTOR.last_activity.pop(code, None)
+        LAST_CONNECTED.pop(code, None)
+
+    metrics.incr("reaper.rooms_reclaimed", len(reclaimed))
+    metrics.incr("reaper.memberships_cleared", sum(len(members[c]) for c in reclaimed))
+    print(f"Reaper: reclaimed {len(reclaimed)} abandoned rooms ({len(deleted)} deleted)")
+    return len(reclaimed)
+
+
+async def reaper_task():
+    while True:
+        await asyncio.sleep(REAP_INTERVAL)
+        try:
+            reap_abandoned_rooms()
+        except Exception as e:
+            # Never let one bad room kill the reaper
+            print(f"Warning: Reaper failed: {e}")
+            metrics.incr("reaper.failures")
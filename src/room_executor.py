@@ -0,0 +1,77 @@
+import asyncio
+import time
+from collections import defaultdict
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Callable
+
+import metrics
+from models.room import Room
+
+
+class RoomExecutor:
+    """
+    Serializes every mutation of a room's draft / state.
+
+    Picks, leaves, advancements, ready toggles and pick timers all go through
+    mutate(), which holds a per-room lock and loads the room fresh once the
+    lock is held. Different rooms never wait on each other.
+    """
+
+    def __init__(self):
+        self.locks: dict[str, asyncio.Lock] = dict()
+        # Number of coroutines waiting for (not holding) each room's lock
+        self.depth: defaultdict[str, int] = defaultdict(lambda: 0)
+        self.last_activity: dict[str, float] = dict()
+        # Called with the room after every successful mutation
+        self.listeners: list[Callable[[Room], None]] = list()
+
+    def add_listener(self, fn: Callable[[Room], None]):
+        self.listeners.append(fn)
+
+    def busy(self, code: str) -> bool:
+        lock = self.locks.get(code)
+        return lock is not None and lock.locked()
+
+    @asynccontextmanager
+    async def mutate(self, code: str) -> AsyncIterator[Room | None]:
+        from rooms import get_room_from_code
+
+        lock = self.locks.get(code)
+        if lock is None:
+            lock = self.locks[code] = asyncio.Lock()
+
+        self.depth[code] += 1
+        metrics.incr("room_executor.mutations")
+        started = time.monotonic()
+        try:
+            await lock.acquire()
+        finally:
+            self.depth[code] -= 1
+        metrics.observe("room_executor.wait_seconds", time.monotonic() - started)
+
+        try:
+            room = get_room_from_code(code)
+            yield room
+            self.last_activity[code] = time.time()
+            if room is not None:
+                for fn in self.listeners:
+                    fn(room)
+        finally:
+            lock.release()
+            if self.depth[code] == 0 and not lock.locked():
+                # Nobody else is waiting, don't keep locks for dead rooms around
+                self.locks.pop(code, None)
+                self.depth.pop(code, None)
+
+    def stats(self) -> dict:
+        waiting = {k: v for k, v in self.depth.items() if v}
+        return {
+            "active_rooms": len(self.locks),
+            "queue_depth": sum(waiting.values()),
+            "max_queue_depth": max(waiting.values(), default=0),
+            "waiting": waiting,
+        }
+
+
+EXECUTOR = RoomExecutor()
+metrics.register_collector("room_executor", EXECUTOR.stats)
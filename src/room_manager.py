@@ -1,99 +1,336 @@
-from collections import defaultdict
+import time
+from collections import deque
+from typing import Iterable
 
 from fastapi import WebSocket, WebSocketDisconnect
 from pydantic import BaseModel
 
-from db import PopulatedUser, get_user_status
+import metrics
+from connection import Connection
+from room_executor import EXECUTOR
+from db import PopulatedUser, get_user_statuses
+from frames import Frame, player_update
+from presence import PRESENCE
+from versions import VERSIONS
 from models.room import Room, RoomConfig
-from models.ws import PlayerActionEnum, PlayerUpdate, RoomUpdate, RoomUpdateEnum, serialize
-from utils import LOG
+from models.ws import MemberSnapshot, PlayerActionEnum, RoomResync, RoomSnapshot, RoomUpdate, RoomUpdateEnum, serialize
+from utils import LOG, env_float
 import rooms
 
-# Registered clients
-CLIENT_TO_WEBSOCKET: dict[str, WebSocket] = dict()
-WEBSOCKET_TO_CLIENT: dict[WebSocket, str] = dict()
+GOING_AWAY = 1001
+# Broadcasts kept per room for replaying to reconnecting clients
+REPLAY_BUFFER = int(env_float("DRAAFT_REPLAY_BUFFER", 256))
+# Rooms one socket can follow besides its own
+MAX_SUBSCRIPTIONS = int(env_float("DRAAFT_WS_MAX_SUBSCRIPTIONS", 16))
 
-async def handle_client_metadata(metadata: str, full_user: PopulatedUser, websocket: WebSocket):
+async def handle_client_metadata(metadata: str, full_user: PopulatedUser, conn: Connection):
     block = metadata.strip('# \n')
     if block == 'register_client':
-        if full_user.uuid in CLIENT_TO_WEBSOCKET:
+        if not PRESENCE.register_client(conn):
             raise WebSocketDisconnect(1000, reason = "cannot connect twice")
-        CLIENT_TO_WEBSOCKET[full_user.uuid] = websocket
-        WEBSOCKET_TO_CLIENT[websocket] = full_user.uuid
         return
 
-    if full_user.uuid not in CLIENT_TO_WEBSOCKET:
+    if full_user.uuid not in PRESENCE.clients:
         # Invalid? I guess.
         LOG("Got bad data from non-client:", metadata)
         return
 
     if block in ['ready', 'unready']:
-        r = full_user.get_room()
-        if r is None:
-            return
-        await r.set_ready(full_user.uuid, block)
+        from db_utils import locked_user_room
+        async with locked_user_room(full_user) as r:
+            if r is None:
+                return
+            await r.set_ready(full_user.uuid, block)
+
+
+
+class RoomLog:
+    """
+    Recent broadcasts of one room, each tagged with a per-room sequence number.
+    """
+
+    __slots__ = ("seq", "frames")
 
+    def __init__(self, seq: int | None = None):
+        # Start at the wall clock (ms) rather than 0 so that a `since` from
+        # before a restart reads as a gap instead of matching unrelated events.
+        self.seq = int(time.time() * 1000) if seq is None else seq
+        self.frames: deque[tuple[int, Frame]] = deque(maxlen=REPLAY_BUFFER)
+
+    def append(self, frame: Frame, seq: int | None = None) -> Frame:
+        # seq comes from the bus when it numbers events itself
+        if seq is None:
+            seq = self.seq + 1
+        self.seq = max(self.seq, seq)
+        f = frame.sequenced(seq)
+        self.frames.append((seq, f))
+        return f
+
+    def since(self, seq: int) -> list[Frame] | None:
+        # None if we can't tell what the client missed
+        if seq == self.seq:
+            return []
+        if seq > self.seq or not self.frames or seq < self.frames[0][0] - 1:
+            return None
+        return [f for s, f in self.frames if s > seq]
 
 
 class RoomManager:
     def __init__(self):
-        self.users: defaultdict[str, set[WebSocket]] = defaultdict(lambda: set())
-        self.room_updates = dict()
-
-    def subscribe(self, websocket: WebSocket, user: PopulatedUser):
-        self.users[user.uuid].add(websocket)
-
-    def unsubscribe(self, websocket: WebSocket, user: PopulatedUser):
-        self.users[user.uuid].remove(websocket)
-        if websocket in WEBSOCKET_TO_CLIENT:
-            u = WEBSOCKET_TO_CLIENT[websocket]
-            WEBSOCKET_TO_CLIENT.pop(websocket)
-            CLIENT_TO_WEBSOCKET.pop(u)
-
-    async def broadcast_room(self, room: Room, data: BaseModel):
-        ser = serialize(data)
-        for m in room.members:
-            wso = self.users.get(m)
-            if wso is None:
-                LOG("No websockets found for user", m)
+        self.logs: dict[str, RoomLog] = dict()
+        # code -> every socket that gets the room's events: its members' sockets
+        # plus sockets watching it. Broadcasts go straight to this set.
+        self.rooms: dict[str, set[Connection]] = dict()
+        # code -> (seq it was built at, encoded RoomSnapshot)
+        self.snapshots: dict[str, tuple[int, Frame]] = dict()
+
+    def subscribe(self, websocket: WebSocket, user: PopulatedUser, binary_positions: bool = False, compress: bool = False) -> Connection:
+        conn = Connection(websocket, user.uuid, binary_positions, compress)
+        PRESENCE.connect(conn)
+        return conn
+
+    def unsubscribe(self, conn: Connection) -> bool:
+        # Safe to call twice (heartbeat reaping + the receive loop exiting),
+        # returns whether this call actually removed the connection.
+        from spectators import SPECTATORS
+        conn.close()
+        SPECTATORS.unwatch(conn)
+        removed = PRESENCE.disconnect(conn)
+        for code in conn.rooms():
+            self._detach(conn, code)
+        conn.room = None
+        conn.watching.clear()
+        return removed
+
+    def drop(self, conn: Connection):
+        # For connections we gave up on (missed heartbeats). The receive loop
+        # of a half-open socket may never wake up, so clean up for it.
+        conn.evict(GOING_AWAY)
+        self.unsubscribe(conn)
+
+    def _attach(self, conn: Connection, code: str):
+        self.rooms.setdefault(code, set()).add(conn)
+
+    def _detach(self, conn: Connection, code: str):
+        conns = self.rooms.get(code)
+        if conns is None:
+            return
+        conns.discard(conn)
+        if not conns:
+            del self.rooms[code]
+
+    def set_member_room(self, conn: Connection, code: str | None):
+        if conn.room is not None:
+            PRESENCE.exit(conn, conn.room)
+            if conn.room not in conn.watching:
+                self._detach(conn, conn.room)
+        conn.room = code
+        if code is not None:
+            if code in conn.watching:
+                # Was following it from outside, now it's just their room
+                from spectators import SPECTATORS
+                conn.watching.discard(code)
+                SPECTATORS.unwatch(conn, code)
+            self._attach(conn, code)
+            PRESENCE.enter(conn, code)
+
+    def join_room(self, code: str, uuid: str):
+        # Membership changed: every socket of the user follows it
+        for conn in PRESENCE.sockets(uuid):
+            self.set_member_room(conn, code)
+
+    def leave_room(self, code: str, uuid: str):
+        for conn in PRESENCE.sockets(uuid):
+            if conn.room == code:
+                self.set_member_room(conn, None)
+
+    def watch(self, conn: Connection, code: str):
+        # Follow a room without being a member, e.g. to spectate it
+        conn.watching.add(code)
+        self._attach(conn, code)
+
+    def unwatch(self, conn: Connection, code: str):
+        conn.watching.discard(code)
+        if conn.room != code:
+            self._detach(conn, code)
+
+    def follow(self, conn: Connection, code: str) -> bool:
+        # Spectate another room on this same socket. It just joins that room's
+        # fan-out set, so N rooms still cost one socket and one send queue.
+        from spectators import SPECTATORS
+        if code == conn.room or code in conn.watching:
+            return True
+        if len(conn.watching) >= MAX_SUBSCRIPTIONS:
+            return False
+        room = rooms.get_room_from_code(code)
+        if room is None:
+            return False
+        self.watch(conn, room.code)
+        conn.send(self.room_snapshot(room))
+        SPECTATORS.watch(room.code, conn)
+        return True
+
+    def unfollow(self, conn: Connection, code: str):
+        from spectators import SPECTATORS
+        if code not in conn.watching:
+            return
+        if code != conn.room:
+            SPECTATORS.unwatch(conn, code)
+        self.unwatch(conn, code)
+
+    async def broadcast_room(self, room: Room, data: BaseModel | Frame):
+        # Only enqueues - each socket's writer task does the actual sending,
+        # so a slow socket can't hold up the room (or whoever triggered this).
+        # Every recipient shares the same encoded frame.
+        from bus import BUS
+        from coalesce import COALESCER
+        frame = Frame.of(data)
+        if frame.coalesce is not None:
+            COALESCER.submit(room.code, room.members, frame, *frame.coalesce,
+                             msg=data if isinstance(data, BaseModel) else None)
+            return
+        COALESCER.flush_room(room.code)
+        BUS.publish(room.code, room.members, frame)
+
+    def deliver(self, code: str, members: Iterable[str], frame: Frame,
+                binary: Frame | None = None, sequenced: bool = True, seq: int | None = None,
+                remote: bool = False):
+        # Called by the bus, in every process, for events about any room
+        from spectators import SPECTATORS
+        if remote:
+            # Joins handled by another worker never touched our index
+            for m in members:
+                for conn in PRESENCE.sockets(m):
+                    if conn.room != code:
+                        self.set_member_room(conn, code)
+        if sequenced:
+            VERSIONS.touch(code)
+            log = self.logs.get(code)
+            if log is None:
+                log = self.logs[code] = RoomLog(seq - 1 if seq is not None else None)
+            frame = log.append(frame, seq)
+        conns = self.rooms.get(code)
+        if conns:
+            self.send_to(code, conns, frame, binary, SPECTATORS.offer(code, frame, binary))
+
+    def replay(self, conn: Connection, room: Room, since: int):
+        # Reconnect: send only what was missed, or the whole room if we can't
+        log = self.logs.get(room.code)
+        frames = log.since(since) if log is not None else None
+        if frames is None:
+            metrics.incr("ws.resyncs")
+            conn.send(Frame.of(RoomResync(seq=log.seq if log is not None else 0, room=room)))
+            return
+        metrics.incr("ws.replayed_frames", len(frames))
+        for f in frames:
+            conn.send(f)
+
+    def forget_room(self, code: str):
+        from coalesce import COALESCER
+        from spectators import SPECTATORS
+        COALESCER.drop_room(code)
+        for conn in self.rooms.pop(code, ()):
+            if conn.room == code:
+                conn.room = None
+            conn.watching.discard(code)
+            SPECTATORS.unwatch(conn, code)
+        self.logs.pop(code, None)
+        self.snapshots.pop(code, None)
+        VERSIONS.forget(code)
+        PRESENCE.forget_room(code)
+        SPECTATORS.forget(code)
+
+    def send_to(self, code: str, conns: Iterable[Connection], frame: Frame, binary: Frame | None = None, spectators: str | None = "direct"):
+        # binary: alternative encoding for sockets that negotiated it
+        # spectators: lowest spectator tier that gets this one live, see
+        # SpectatorFeed.offer
+        # Sockets following other rooms too get the room code spliced in, once
+        # per event however many of them there are. Followers that aren't
+        # members get the seeds blanked.
+        from spectators import OVERFLOW
+        tagged: dict[Frame, Frame] = dict()
+        for conn in list(conns):
+            tier = conn.spectating.get(code)
+            if tier is not None and (spectators is None or (tier == OVERFLOW and spectators != OVERFLOW)):
+                continue
+            if binary is not None and conn.binary_positions:
+                conn.send(binary)
                 continue
-            for ws in wso:
-                await ws.send_text(ser)
+            f = frame if conn.room == code else frame.public()
+            if conn.watching and f.text is not None:
+                t = tagged.get(f)
+                if t is None:
+                    t = tagged[f] = f.tagged(code)
+                conn.send(t)
+            else:
+                conn.send(f)
 
-    async def send_ws(self, ws: WebSocket, data: BaseModel):
-        await ws.send_text(serialize(data))
+    async def send_ws(self, conn: Connection, data: BaseModel | Frame):
+        conn.send(Frame.of(data))
 
     async def add_user(self, room: Room, user: str):
         if not rooms.add_room_member(room.code, user):
             LOG("Failed adding user", user, "to room", room.code)
             return False
+        self.join_room(room.code, user)
         LOG("Broadcasting room", room.code, "notice that player", user, "joined.")
-        await self.broadcast_room(room, PlayerUpdate(uuid=user, action=PlayerActionEnum.joined))
+        await self.broadcast_room(room, player_update(user, PlayerActionEnum.joined))
         return True
 
     async def update_status(self, room: Room, user: str, status: PlayerActionEnum):
-        await self.broadcast_room(room, PlayerUpdate(uuid=user, action=status))
+        from spectators import SPECTATORS
+        await self.broadcast_room(room, player_update(user, status))
+        SPECTATORS.set_spectating(room.code, PRESENCE.sockets(user), status == PlayerActionEnum.spectate)
 
     async def update_room(self, room: Room, c: RoomConfig):
-        from asyncio import create_task
-        # TODO: This should really be buffered. Update the room after a second with the latest information.
-        # Update the db first, then send the update, I guess
-        if room.code not in self.room_updates:
-            create_task(update_room_delayed(self, room))
-        self.room_updates[room.code] = c
-
-    async def send_join(self, ws: WebSocket, room: Room):
+        # Buffered: RoomUpdate config messages coalesce, so a burst of edits
+        # only sends the latest config
+        await self.broadcast_room(room, RoomUpdate(update=RoomUpdateEnum.config, config=c))
+
+    async def send_join(self, conn: Connection, room: Room):
         # Send any information that wasn't initially sent.
-        for m in room.members:
-            if get_user_status(m) != "player":
-                await self.send_ws(ws, PlayerUpdate(uuid=m, action=PlayerActionEnum.spectate))
+        conn.send(self.room_snapshot(room))
+        # Start versioning the room, so its patches reach this socket
+        VERSIONS.sync(room)
 
+    def room_snapshot(self, room: Room) -> Frame:
+        # Anything a client can see change comes with a broadcast (new seq),
+        # and silent mutations drop the cache through the executor listener.
+        log = self.logs.get(room.code)
+        seq = log.seq if log is not None else 0
+        cached = self.snapshots.get(room.code)
+        if cached is not None and cached[0] == seq:
+            metrics.incr("room_snapshot.hits")
+            return cached[1]
+        metrics.incr("room_snapshot.builds")
+        frame = Frame.of(build_snapshot(room, seq))
+        self.snapshots[room.code] = (seq, frame)
+        return frame
 
-mg = RoomManager()
+    def invalidate_snapshot(self, room: Room):
+        self.snapshots.pop(room.code, None)
 
-async def update_room_delayed(mgr: RoomManager, room: Room):
-    from asyncio import sleep
-    await sleep(1)
-    c = mgr.room_updates[room.code]
-    mgr.room_updates.pop(room.code)
-    await mgr.broadcast_room(room, RoomUpdate(update=RoomUpdateEnum.config, config=c))
+
+def build_snapshot(room: Room, seq: int) -> RoomSnapshot:
+    members = sorted(room.members)
+    statuses = get_user_statuses(members) if members else {}
+    adv = room.state.player_advancements
+    return RoomSnapshot(
+        seq=seq,
+        code=room.code,
+        admin=room.admin,
+        members=[MemberSnapshot(
+            uuid=m,
+            status=statuses[m],
+            ready=m in room.state.ready_players,
+            advancements=len(adv.get(m, ())),
+        ) for m in members],
+        drafting=room.drafting(),
+        playing=room.playing(),
+        position=room.draft.position if room.drafting() and room.draft is not None else None,
+    )
+
+
+mg = RoomManager()
+EXECUTOR.add_listener(mg.invalidate_snapshot)
+EXECUTOR.add_listener(lambda room: VERSIONS.touch(room.code))
@@ -1,9 +1,10 @@
 import string
 import random
 from sqlite3 import IntegrityError
-from draft import Draft
+from draft import Draft, DraftPick
 
 from models.room import Room, RoomConfig, RoomState
+from models.runtime import RuntimeRoom
 from models.ws import deserialize, serialize
 from utils import LOG
 
@@ -33,43 +34,62 @@ def create(uuid: str) -> str:
             continue
 
 
-def get_draft_from_line(line: tuple):
-    return deserialize(line[4], Draft)
+def get_draft_from_line(line: tuple, picks: list[tuple[str, str]]):
+    return Draft.from_log(line[4], picks)
 def get_config_from_line(line: tuple):
     return deserialize(line[3], RoomConfig)
 def get_state_from_line(line: tuple):
     return deserialize(line[5], RoomState)
 
-def get_room_from_code(room_code: str) -> Room | None:
+def _fetch_room(room_code: str) -> tuple[tuple, set[str], list[tuple[str, str]]] | None:
     from db import sql
 
-    """ Returns a Room object from a room code, or None if not found """
     if not room_code:
         return None
     with sql as cur:
         res = cur.execute("SELECT * FROM rooms WHERE code = ?", (room_code,)).fetchall()
         if not res:
             return None
-        room_code = res[0][1]
-        admin = res[0][2]
         members_res = cur.execute(
-            "SELECT uuid FROM users WHERE room_code = ?", (room_code,)
+            "SELECT uuid FROM users WHERE room_code = ?", (res[0][1],)
         ).fetchall()
+        picks = []
+        if res[0][4] is not None:
+            picks = cur.execute(
+                "SELECT key, player FROM picks WHERE room = ? ORDER BY idx", (res[0][1],)
+            ).fetchall()
 
     # So because of how this normalization level works, we can't assume the
     # room has any players in it. Just a head's up on that.
-    members = set(m[0] for m in members_res)
-    room_code = str(room_code) if room_code is not None else ""
-    rc = get_config_from_line(res[0])
+    return res[0], set(m[0] for m in members_res), picks
+
+
+def get_room_from_code(room_code: str) -> Room | None:
+    """ Returns a Room object from a room code, or None if not found """
+    fetched = _fetch_room(room_code)
+    if fetched is None:
+        return None
+    line, members, picks = fetched
+    admin = line[2]
+    room_code = str(line[1]) if line[1] is not None else ""
+    rc = get_config_from_line(line)
     if rc is None:
-        print("ERROR: Could not deserialize room config:", res[0][3])
+        print("ERROR: Could not deserialize room config:", line[3])
         rc = RoomConfig()
-    dr = get_draft_from_line(res[0])
-    roomstate = get_state_from_line(res[0])
+    dr = get_draft_from_line(line, picks)
+    roomstate = get_state_from_line(line)
     assert roomstate is not None
     return Room(code=room_code, members=members, admin=admin, config=rc, draft=dr, state=roomstate)
 
 
+def get_runtime_room(room_code: str) -> RuntimeRoom | None:
+    """ Same as get_room_from_code, but skips pydantic (for read-mostly hot paths) """
+    fetched = _fetch_room(room_code)
+    if fetched is None:
+        return None
+    return RuntimeRoom.from_row(*fetched)
+
+
 def update_config(config: str, code: str) -> bool:
     from db import sql
 
@@ -82,15 +102,23 @@ def update_config(config: str, code: str) -> bool:
         return False
 
 
-def update_draft(draft: Draft, code: str) -> bool:
+def update_draft(draft: Draft, code: str, pick: DraftPick | None = None) -> bool:
     from db import sql
 
-    """ Adds a user to a room by room code. Returns True on success, False on failure (room not found or other db issue) """
+    """
+    Saves the draft header, and appends `pick` to the room's pick log if
+    given. Returns True on success, False on failure (e.g. a pick with that
+    index is already logged)
+    """
     try:
-        draft_ser = serialize(draft)
         with sql as cur:
+            if pick is not None:
+                cur.execute(
+                    "INSERT INTO picks (room, idx, key, player) VALUES (?,?,?,?)",
+                    (code, pick.index, pick.key, pick.player),
+                )
             cur.execute(
-                "UPDATE rooms SET draft = ? WHERE code = ?", (draft_ser, code)
+                "UPDATE rooms SET draft = ? WHERE code = ?", (draft.header(), code)
             )
         return True
     except IntegrityError:
@@ -127,6 +155,7 @@ def remove_room_member(uuid: str, allow_no_admin: bool = False) -> bool:
             if not rm.state.has_sent_start:
                 with sql as cur:
                     cur.execute("DELETE FROM rooms WHERE code = ?", (rm.code,))
+                    cur.execute("DELETE FROM picks WHERE room = ?", (rm.code,))
         else:
             uuids = [uuid]
         fmt = ",".join("?" * len(uuids))
@@ -149,6 +178,7 @@ def destroy_room(code: str):
         if not rm.state.has_sent_start:
             with sql as cur:
                 cur.execute("DELETE FROM rooms WHERE code = ?", (rm.code,))
+                cur.execute("DELETE FROM picks WHERE room = ?", (rm.code,))
         # Remove all its members
         fmt = ",".join("?" * len(uuids))
         with sql as cur:
@@ -1,5 +1,6 @@
 from random import choice
 import time
+from contextlib import asynccontextmanager
 from typing import Any, Callable, Coroutine
 from datapack_utils import setup_datapack_caching
 import asyncio
@@ -23,7 +24,6 @@ import db
 import rooms
 from db import (
     get_admin_from_request,
-    get_admin_in_unstarted_room,
     get_user_status,
     insert_update_status,
     insert_user,
@@ -39,20 +39,27 @@ from models.api import (
 from models.generic import LoggedInUser, MojangInfo, OQInfo, UserSettings
 from models.room import Room, RoomIdentifier, RoomJoinError, RoomJoinState, RoomResult
 from models.ws import (
+    Heartbeat,
     PlayerActionEnum,
-    PlayerUpdate,
+    RoomDelta,
     RoomUpdate,
     RoomUpdateEnum,
-    WebSocketMessage,
+    Subscribe,
+    Unsubscribe,
+    decode_message,
     serialize,
 )
 from utils import get_user_from_request, validate_mojang_session, LOG, persistent_token
 import sys
 from room_manager import mg, handle_client_metadata
+from room_executor import EXECUTOR
+from frames import ERROR_STATUS, ROOM_CLOSED, player_update
 from draft import rt
 from lb import rt as lb_rt
 from bracket import rt as bk_rt
+from lobby import rt as lobby_rt, LOBBY
 from game import insert_test_completions, autoload_completions
+from db_utils import locked_admin_in_unstarted_room
 
 setup_sqlite()
 setup_datapack_caching()
@@ -77,10 +84,39 @@ if DEV_MODE_NO_AUTHENTICATE and "dev" not in sys.argv:
 # https://sessionserver.mojang.com/session/minecraft/hasJoined?username=DesktopFolder&serverId=draaft2025server
 
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(_: FastAPI):
+    from bus import BUS
+    from heartbeat import heartbeat_task
+    from positions import position_task
+    from spectators import spectator_task
+    from versions import versions_task
+    from coalesce import COALESCER
+    from reaper import reaper_task
+    from snapshot import restore_snapshot, save_snapshot, snapshot_task
+    restore_snapshot()
+    LOBBY.load()
+    tasks = [
+        asyncio.create_task(reaper_task()),
+        asyncio.create_task(snapshot_task()),
+        asyncio.create_task(position_task()),
+        asyncio.create_task(heartbeat_task()),
+        asyncio.create_task(BUS.run()),
+        asyncio.create_task(spectator_task()),
+        asyncio.create_task(COALESCER.run()),
+        asyncio.create_task(versions_task()),
+    ]
+    yield
+    for t in tasks:
+        t.cancel()
+    save_snapshot()
+
+
+app = FastAPI(lifespan=lifespan)
 app.include_router(rt)
 app.include_router(lb_rt)
 app.include_router(bk_rt)
+app.include_router(lobby_rt)
 
 ################## Middlewares #####################
 
@@ -100,7 +136,9 @@ PUBLIC_ROUTES = {
     "/dev/becomeuser",
     "/draft/external/draftables",
     "/bracket/external/current",
+    "/bracket/external/current/stream",
     "/draft/external/livestatus",
+    "/draft/external/livestatus/stream",
     "/draft/external/room",
     "/draft/external/live",
     "/lb/external/oq1",
@@ -332,21 +370,20 @@ async def lookup_user(useridentifier: str):
 
 @app.post("/admin/register_completion/{room_id}")
 async def register_completion_manually(request: Request, room_id: str):
-    from rooms import get_room_from_code
     user = get_user_from_request(request)
     if user is None:
         return
     if user.username != "DesktopFolder":
         return
 
-    rm = get_room_from_code(room_id)
-    if rm is None:
-        raise HTTPException(status_code=503, detail="Failure: No room.")
-    
-    if rm.state.latest_advancement is None:
-        raise HTTPException(status_code=503, detail="Failure: No latest advancement")
+    async with EXECUTOR.mutate(room_id) as rm:
+        if rm is None:
+            raise HTTPException(status_code=503, detail="Failure: No room.")
 
-    rm.register_completion(rm.admin, rm.state.latest_advancement)
+        if rm.state.latest_advancement is None:
+            raise HTTPException(status_code=503, detail="Failure: No latest advancement")
+
+        rm.register_completion(rm.admin, rm.state.latest_advancement)
 
 
 async def handle_room_rejoin(
@@ -378,7 +415,7 @@ async def handle_room_rejoin(
 
 
 @app.get("/room")
-async def get_room(request: Request, response: Response) -> Room | APIError:
+async def get_room(request: Request, response: Response, since: int | None = None) -> Room | RoomDelta | APIError:
     print("Getting room for user...")
     user = get_user_from_request(request)
     assert user
@@ -389,6 +426,13 @@ async def get_room(request: Request, response: Response) -> Room | APIError:
             response,
             status.HTTP_404_NOT_FOUND,
         )
+    if since is not None:
+        # Just what changed since the client's version, when we still know
+        from versions import VERSIONS
+        rv = VERSIONS.current(user.room_code)
+        ops = rv.since(since) if rv is not None else None
+        if ops is not None:
+            return RoomDelta(version=rv.version, base=since, ops=ops)
     room = rooms.get_room_from_code(user.room_code)
     print(f"Got room: {room}")
     if room is None:
@@ -397,6 +441,8 @@ async def get_room(request: Request, response: Response) -> Room | APIError:
             response,
             status.HTTP_404_NOT_FOUND,
         )
+    if since is not None:
+        return RoomDelta(version=VERSIONS.sync(room).version, room=room)
     return room
 
 
@@ -410,6 +456,8 @@ async def create_room(request: Request) -> RoomResult:
     if rejoin_result is not None:
         return rejoin_result
     room_code = rooms.create(user.uuid)
+    LOBBY.invalidate(room_code)
+    mg.join_room(room_code, user.uuid)
     room = rooms.get_room_from_code(room_code)
     assert room is not None
     return RoomResult(code=room_code, state=RoomJoinState.created, members=[user.uuid], room=room)
@@ -426,35 +474,36 @@ async def join_room(
         LOG("Got rejoin result:", rejoin_result)
         return rejoin_result
     LOG("Fresh room join from user", user.username)
-    room = rooms.get_room_from_code(room_code.code)
-    if room is None:
-        return api_error(
-            RoomJoinError(error_message=f"no such room: {room_code.code}"), response
-        )
-    # User can join this room! room room room room HAAHAHAAHA TAKE THAT YOU ROOMS
-    user.room_code = room_code.code
-    addUserAttempt = rooms.add_room_member(room_code.code, user.uuid)
-    if not addUserAttempt:
-        # At some point we might want to differentiate these errors (i.e. room full vs other)
-        return api_error(
-            RoomJoinError(
-                error_message=f"could not add user to room: {room_code.code}"
-            ),
-            response,
-        )
+    async with EXECUTOR.mutate(room_code.code) as room:
+        if room is None:
+            return api_error(
+                RoomJoinError(error_message=f"no such room: {room_code.code}"), response
+            )
+        # User can join this room! room room room room HAAHAHAAHA TAKE THAT YOU ROOMS
+        user.room_code = room_code.code
+        addUserAttempt = rooms.add_room_member(room_code.code, user.uuid)
+        if not addUserAttempt:
+            # At some point we might want to differentiate these errors (i.e. room full vs other)
+            return api_error(
+                RoomJoinError(
+                    error_message=f"could not add user to room: {room_code.code}"
+                ),
+                response,
+            )
 
-    # Add the user to the room first, THEN broadcast to the room.
-    room.members.add(user.uuid)
-    await mg.broadcast_room(
-        room, PlayerUpdate(uuid=user.uuid, action=PlayerActionEnum.joined)
-    )
+        # Add the user to the room first, THEN broadcast to the room.
+        room.members.add(user.uuid)
+        mg.join_room(room.code, user.uuid)
+        await mg.broadcast_room(
+            room, player_update(user.uuid, PlayerActionEnum.joined)
+        )
 
-    # If the room is already live
-    if room.drafting() or room.playing() or (room.config.restrict_players and user.uuid not in room.config.restrict_players):
-        await mg.update_status(room, user.uuid, PlayerActionEnum.spectate)
-        insert_update_status(user.uuid, "spectate")
+        # If the room is already live
+        if room.drafting() or room.playing() or (room.config.restrict_players and user.uuid not in room.config.restrict_players):
+            await mg.update_status(room, user.uuid, PlayerActionEnum.spectate)
+            insert_update_status(user.uuid, "spectate")
 
-    return room.as_result(state=RoomJoinState.joined)
+        return room.as_result(state=RoomJoinState.joined)
 
 
 @app.post("/room/leave")
@@ -466,35 +515,41 @@ async def leave_room(request: Request):
     if rm is None:
         LOG("Could not leave room - Room does not exist")
         return
-    room = rooms.get_room_from_code(rm)
-    if room is None:
-        LOG(f"Error: Could not get room from id {rm}")
-        return
-    isadmin = room.admin == user.uuid
+    async with EXECUTOR.mutate(rm) as room:
+        if room is None:
+            LOG(f"Error: Could not get room from id {rm}")
+            return
+        isadmin = room.admin == user.uuid
 
-    # ONLY delete the room for admins IFF draft is None
-    # Note: We broadcast the information first, THEN remove the player
-    if isadmin and room.draft is None:
-        await mg.broadcast_room(room, RoomUpdate(update=RoomUpdateEnum.closed))
-    else:
-        await mg.broadcast_room(
-            room, PlayerUpdate(uuid=user.uuid, action=PlayerActionEnum.leave)
-        )
-    rooms.remove_room_member(user.uuid, room.draft is not None)
+        # ONLY delete the room for admins IFF draft is None
+        # Note: We broadcast the information first, THEN remove the player
+        if isadmin and room.draft is None:
+            await mg.broadcast_room(room, ROOM_CLOSED)
+        else:
+            await mg.broadcast_room(
+                room, player_update(user.uuid, PlayerActionEnum.leave)
+            )
+        rooms.remove_room_member(user.uuid, room.draft is not None)
+        if isadmin and room.draft is None:
+            # That took everybody out of the room
+            mg.forget_room(room.code)
+        else:
+            mg.leave_room(room.code, user.uuid)
 
-    if room.draft is not None:
-        if user.uuid in room.draft.players:
-            room.draft.skip_players.add(user.uuid)
-            # Update it here so we don't do it later
-            update_draft(room.draft, room.code)
+        if room.draft is not None:
+            if user.uuid in room.draft.players:
+                room.draft.skip_players.add(user.uuid)
+                # Update it here so we don't do it later
+                update_draft(room.draft, room.code)
 
-            # DESTROY THE ROOM IF EVERYONE LEAVES
-            if all([p in room.draft.skip_players for p in room.draft.players]):
-                destroy_room(room.code)
-                await mg.broadcast_room(room, RoomUpdate(update=RoomUpdateEnum.closed))
-                return # Return, don't do more logic
+                # DESTROY THE ROOM IF EVERYONE LEAVES
+                if all([p in room.draft.skip_players for p in room.draft.players]):
+                    destroy_room(room.code)
+                    await mg.broadcast_room(room, ROOM_CLOSED)
+                    mg.forget_room(room.code)
+                    return # Return, don't do more logic
 
-            await room.draft.do_skip(room)
+                await room.draft.do_skip(room)
 
 
 @app.post("/room/kick")
@@ -505,47 +560,48 @@ async def kick_room(request: Request, member: str):
     if rm is None:
         LOG("Could not kick from room - Room does not exist")
         return
-    room = rooms.get_room_from_code(rm)
-    if room is None:
-        LOG(f"Error: Could not get room from id {rm}")
-        return
-    isadmin = room.admin == user.uuid
-    if not isadmin or member == user.uuid:
-        # They are not the room admin, kick them.
-        # Alternatively, you can't kick yourself.
-        return
-    if member not in room.members:
-        # Member also just doesn't exist.
-        LOG("Could not kick from room - member is not in room.")
-        return
+    async with EXECUTOR.mutate(rm) as room:
+        if room is None:
+            LOG(f"Error: Could not get room from id {rm}")
+            return
+        isadmin = room.admin == user.uuid
+        if not isadmin or member == user.uuid:
+            # They are not the room admin, kick them.
+            # Alternatively, you can't kick yourself.
+            return
+        if member not in room.members:
+            # Member also just doesn't exist.
+            LOG("Could not kick from room - member is not in room.")
+            return
 
-    # Broadcast information first, THEN remove the player from the room.
-    await mg.broadcast_room(
-        room, PlayerUpdate(uuid=member, action=PlayerActionEnum.kick)
-    )
-    rooms.remove_room_member(member)
+        # Broadcast information first, THEN remove the player from the room.
+        await mg.broadcast_room(
+            room, player_update(member, PlayerActionEnum.kick)
+        )
+        rooms.remove_room_member(member)
+        mg.leave_room(room.code, member)
 
 
 @app.post("/room/swapstatus")
 async def swap_status(request: Request, uuid: str):
-    ad = get_admin_in_unstarted_room(request)
-    if ad is None:
-        return
-    _, r = ad
+    async with locked_admin_in_unstarted_room(request) as ad:
+        if ad is None:
+            return
+        _, r = ad
 
-    # actually important check!
-    if uuid not in r.members:
-        return
+        # actually important check!
+        if uuid not in r.members:
+            return
 
-    status = get_user_status(uuid)
-    LOG("Current user status:", status)
-    if status != "player":
-        status = "player"
-        await mg.update_status(r, uuid, PlayerActionEnum.player)
-    else:
-        status = "spectate"
-        await mg.update_status(r, uuid, PlayerActionEnum.spectate)
-    insert_update_status(uuid, status)
+        status = get_user_status(uuid)
+        LOG("Current user status:", status)
+        if status != "player":
+            status = "player"
+            await mg.update_status(r, uuid, PlayerActionEnum.player)
+        else:
+            status = "spectate"
+            await mg.update_status(r, uuid, PlayerActionEnum.spectate)
+        insert_update_status(uuid, status)
 
 
 @app.get("/usersettings")
@@ -576,11 +632,13 @@ async def set_user_settings(request: Request, s: UserSettings):
 
 @app.post("/room/configure")
 async def configure_room(request: Request, payload: Any = Body(None)):
-    ad = get_admin_in_unstarted_room(request)
-    if ad is None:
-        return
-    _, r = ad
+    async with locked_admin_in_unstarted_room(request) as ad:
+        if ad is None:
+            return
+        await _configure_room(ad[1], payload)
+
 
+async def _configure_room(r: Room, payload: Any):
     if payload is None:
         LOG("Got empty payload for /room/configure")
         return
@@ -612,21 +670,21 @@ async def get_live_room():
 
 @app.post("/room/commence")
 async def commence_room(request: Request):
-    ad = get_admin_in_unstarted_room(request)
-    if ad is None:
-        return
-    admin, r = ad
+    async with locked_admin_in_unstarted_room(request) as ad:
+        if ad is None:
+            return
+        admin, r = ad
 
-    if not r.get_players():
-        raise HTTPException(status_code=403, detail=f'Cannot start room {r.code} - no players.')
-    if len(r.get_players()) > 4:
-        raise HTTPException(status_code=403, detail=f'Cannot start room {r.code} - too many players ({len(r.get_players())})')
+        if not r.get_players():
+            raise HTTPException(status_code=403, detail=f'Cannot start room {r.code} - no players.')
+        if len(r.get_players()) > 4:
+            raise HTTPException(status_code=403, detail=f'Cannot start room {r.code} - too many players ({len(r.get_players())})')
 
-    LOG("Commencing room:", r.code)
+        LOG("Commencing room:", r.code)
 
-    r.set_drafting()
-    await mg.broadcast_room(r, RoomUpdate(update=RoomUpdateEnum.commenced, config=r.config))
-    r.start_timer()
+        r.set_drafting()
+        await mg.broadcast_room(r, RoomUpdate(update=RoomUpdateEnum.commenced, config=r.config))
+        r.start_timer()
 
 
 @app.post("/admin/register_completion")
@@ -652,10 +710,20 @@ async def force_register_completion(request: Request, room_id: str, rta_code: st
     # WIP :) do this later
 
 
+@app.get("/admin/metrics")
+async def get_metrics(request: Request):
+    import metrics
+    from models.room import ADMINS
+    user = get_user_from_request(request)
+    if user is None or user.uuid not in ADMINS:
+        raise HTTPException(status_code=403)
+    return metrics.snapshot()
+
+
 @app.get("/checkoq")
 async def check_oq(request: Request) -> OQInfo:
     from db import sql
-    from rooms import get_config_from_line, get_draft_from_line, get_state_from_line
+    from models.runtime import RuntimeRoom
     user = get_user_from_request(request)
     if user is None:
         raise HTTPException(status_code=500, detail="you don't exist")
@@ -669,21 +737,20 @@ async def check_oq(request: Request) -> OQInfo:
 
         res = cur.execute("SELECT * FROM rooms WHERE instr(draft,?) > 0", (user.uuid,)).fetchall()
 
-        for r in res:
-            rc = get_config_from_line(r)
-            if rc is None or not rc.open_qualifier_submission:
-                LOG("OQ Check failed: Room config")
-                continue
-            dr = get_draft_from_line(r)
-            if dr is None or user.uuid not in dr.players:
-                LOG("OQ Check failed: Draft")
-                continue
-            rs = get_state_from_line(r)
-            if rs is None or not rs.has_sent_start:
-                LOG("OQ Check failed: No start")
-                continue
-            # otherwise for now let's just increment
-            theiroq += 1
+    for r in res:
+        rm = RuntimeRoom.from_row(r, set())
+        if not rm.config["open_qualifier_submission"]:
+            LOG("OQ Check failed: Room config")
+            continue
+        dr = rm.draft
+        if dr is None or user.uuid not in dr.players:
+            LOG("OQ Check failed: Draft")
+            continue
+        if not rm.state.has_sent_start:
+            LOG("OQ Check failed: No start")
+            continue
+        # otherwise for now let's just increment
+        theiroq += 1
 
 
     return OQInfo(oq_attempts=theiroq, max_oq_attempts=maxoq, finished_oq=theiroq >= maxoq)
@@ -712,8 +779,11 @@ async def get_user(request: Request, response: Response) -> LoggedInUser | APIEr
 
 
 @app.websocket("/listen")
-async def websocket_endpoint(*, websocket: WebSocket, token: str):
-    from handlers import handle_websocket_message
+async def websocket_endpoint(*, websocket: WebSocket, token: str, since: int | None = None, compress: bool = False, watch: str | None = None):
+    from handlers import handle_binary_message, handle_subscription, handle_websocket_message
+    from positions import BINARY_SUBPROTOCOL
+    from presence import MAX_CONNECTIONS, PRESENCE
+    from spectators import SPECTATORS
 
     LOG("Got a connect / listen call with a websocket")
     try:
@@ -725,32 +795,56 @@ async def websocket_endpoint(*, websocket: WebSocket, token: str):
     if room is None:
         LOG(f"Note: User {user.username} is listening to websocket before joining a room.")
         # return  # User must be in a room to be listening for updates.
-    # Sane maximum
-    if full_user.state.connections >= 10:
+    if PRESENCE.connections(full_user.uuid) >= MAX_CONNECTIONS:
         raise RuntimeError(f"Max connections exceeded for user {user.username}")
-    # Do not increase connections until accept() succeeds
-    await websocket.accept()
-    full_user.state.connections += 1
-    mg.subscribe(websocket, full_user)
-    if room is not None:
-        await mg.send_join(websocket, room)
+    # Clients can ask for packed binary position frames, everything else stays JSON
+    binary = BINARY_SUBPROTOCOL in websocket.scope.get("subprotocols", ())
+    # Do not count the connection until accept() succeeds
+    await websocket.accept(subprotocol=BINARY_SUBPROTOCOL if binary else None)
+    conn = mg.subscribe(websocket, full_user, binary_positions=binary, compress=compress)
+    # From here on, however we leave, the connection gets cleaned up
     try:
+        if room is not None:
+            mg.set_member_room(conn, room.code)
+            if since is not None:
+                # Before anything else can be queued, so replayed and live
+                # events stay in order
+                mg.replay(conn, room, since)
+            await mg.send_join(conn, room)
+            if get_user_status(full_user.uuid) != "player":
+                SPECTATORS.watch(room.code, conn)
+        if watch is not None:
+            # Spectating rooms we're not a member of, same as a subscribe
+            for code in watch.split(","):
+                mg.follow(conn, code)
         while True:
-            data = await websocket.receive_text()
-            LOG('Got websocket data:', data)
+            raw = await websocket.receive()
+            if raw["type"] == "websocket.disconnect":
+                raise WebSocketDisconnect(raw.get("code", 1000))
+            conn.touch()
+            data = raw.get("text")
+            if data is None:
+                if conn.binary_positions and raw.get("bytes"):
+                    handle_binary_message(raw["bytes"], full_user)
+                continue
             if data.startswith("##"):
-                await handle_client_metadata(data, full_user, websocket)
+                await handle_client_metadata(data, full_user, conn)
                 continue
-            message = WebSocketMessage.deserialize(data)
+            message = decode_message(data)
             if message is not None:
-                await handle_websocket_message(websocket, message, full_user)
+                if isinstance(message, Heartbeat):
+                    conn.heartbeats = True
+                    continue
+                if isinstance(message, (Subscribe, Unsubscribe)):
+                    handle_subscription(conn, message)
+                    continue
+                await handle_websocket_message(conn, message, full_user)
             else:
-                await websocket.send_text('{"status": "error"}')
+                conn.send(ERROR_STATUS)
     except WebSocketDisconnect:
-        full_user.state.connections -= 1
+        pass
     finally:
-        mg.unsubscribe(websocket, full_user)
-
+        mg.unsubscribe(conn)
 
 # Development endpoints.
 if DEV_MODE_WEIRD_ENDPOINTS:
@@ -844,7 +938,7 @@ if DEV_MODE_WEIRD_ENDPOINTS:
         if room.admin != user.uuid:
             return
         await mg.broadcast_room(
-            room, PlayerUpdate(uuid=user.uuid, action=PlayerActionEnum.kick)
+            room, player_update(user.uuid, PlayerActionEnum.kick)
         )
         # do nothing on backend. just broadcast the info...
         # rooms.remove_room_member(member)
@@ -0,0 +1,101 @@
+import asyncio
+import json
+import time
+
+import metrics
+from utils import env_float
+
+# Process-local runtime state (pick timers, client registrations, pending
+# debounced broadcasts, activity clocks) gets written here on shutdown and
+# periodically, and restored on boot so a restart doesn't stall drafts.
+SNAPSHOT_FILE = ".runtime-snapshot.json"
+SNAPSHOT_INTERVAL = env_float("DRAAFT_SNAPSHOT_INTERVAL", 15)
+# How long restored clients count as connected while they reconnect
+CLIENT_GRACE = env_float("DRAAFT_CLIENT_GRACE", 60)
+# Client registrations older than this are not worth restoring
+CLIENT_MAX_AGE = 10 * 60
+
+
+def take_snapshot() -> dict:
+    from coalesce import COALESCER
+    from models.room import PICK_DEADLINES
+    from reaper import LAST_CONNECTED
+    from presence import PRESENCE
+    from room_executor import EXECUTOR
+
+    return {
+        "taken_at": time.time(),
+        "pick_deadlines": dict(PICK_DEADLINES),
+        "clients": list(PRESENCE.clients.keys() | PRESENCE.restored.keys()),
+        "coalesced": COALESCER.dump(),
+        "last_activity": dict(EXECUTOR.last_activity),
+        "last_connected": dict(LAST_CONNECTED),
+    }
+
+
+def save_snapshot():
+    import shutil
+    started = time.monotonic()
+    data = take_snapshot()
+    with open(".tmp.snapshot", "w") as file:
+        json.dump(data, file)
+
+    # Do an atomic move
+    shutil.move(".tmp.snapshot", SNAPSHOT_FILE)
+    metrics.observe("snapshot.save_seconds", time.monotonic() - started)
+
+
+def restore_snapshot():
+    """
+    Re-arms pick timers against their remaining time and restores everything
+    else from the last snapshot. Must be called from the running event loop.
+    """
+    import reaper
+    from models.room import BUFFER_PICK, schedule_pick_timer
+    from room_executor import EXECUTOR
+    from coalesce import COALESCER
+    from frames import Frame
+    from presence import PRESENCE
+    from rooms import get_room_from_code
+
+    try:
+        with open(SNAPSHOT_FILE) as file:
+            data = json.load(file)
+    except FileNotFoundError:
+        return
+    except Exception as e:
+        print(f"Warning: Could not load runtime snapshot: {e}")
+        return
+
+    now = time.time()
+    rearmed = 0
+    for code, deadline in data.get("pick_deadlines", {}).items():
+        room = get_room_from_code(code)
+        if room is None or not room.drafting():
+            continue
+        # Overdue timers still give clients a moment to reconnect
+        schedule_pick_timer(code, max(deadline - now, BUFFER_PICK), room.num_picks())
+        rearmed += 1
+
+    for p in data.get("coalesced", []):
+        COALESCER.submit(p["code"], p["members"], Frame(p["frame"]), p["key"], p["delay"])
+
+    if now - data.get("taken_at", 0) < CLIENT_MAX_AGE:
+        PRESENCE.restore_clients(data.get("clients", []), now + CLIENT_GRACE)
+
+    EXECUTOR.last_activity.update(data.get("last_activity", {}))
+    reaper.LAST_CONNECTED.update(data.get("last_connected", {}))
+    # Idle clocks carry on from the snapshot rather than restarting at boot
+    reaper.STARTED_AT = min(reaper.STARTED_AT, data.get("taken_at", now))
+
+    print(f"Restored runtime snapshot: {rearmed} pick timers, {len(PRESENCE.restored)} clients")
+
+
+async def snapshot_task():
+    while True:
+        await asyncio.sleep(SNAPSHOT_INTERVAL)
+        try:
+            save_snapshot()
+        except Exception as e:
+            print(f"Warning: Could not save runtime snapshot: {e}")
+            metrics.incr("snapshot.failures")
@@ -0,0 +1,171 @@
+import asyncio
+import time
+from collections import defaultdict
+
+import metrics
+from connection import Connection
+from frames import Frame
+from utils import env_float
+
+# Spectators don't need every advancement / position the moment it happens,
+# and there can be a lot more of them than players. So:
+#   - the first SPECTATOR_CAP spectator sockets of a room ("direct") get the
+#     important events live, plus a consolidated room snapshot and the latest
+#     positions every SNAPSHOT_INTERVAL if anything changed
+#   - everyone past the cap ("overflow") only gets the shared snapshot frame,
+#     every OVERFLOW_INTERVAL, plus the few room updates (commenced, closed,
+#     ...) that a snapshot can't stand in for
+# Either way a snapshot is built once per room and shared by every viewer, so
+# the cost of an event doesn't grow with the audience.
+SPECTATOR_CAP = int(env_float("DRAAFT_SPECTATOR_CAP", 32))
+SNAPSHOT_INTERVAL = env_float("DRAAFT_SPECTATOR_INTERVAL", 2)
+OVERFLOW_INTERVAL = env_float("DRAAFT_SPECTATOR_OVERFLOW_INTERVAL", 10)
+
+# High frequency events that spectators only see through snapshots. Matched
+# against our own compact JSON, so no whitespace to worry about.
+SNAPSHOT_ONLY = ('"variant":"PlayerAdvancementUpdate"',)
+# Position batches don't change the room, so they don't cost a snapshot: the
+# latest one is just forwarded to direct spectators every tick
+POSITIONS = '"variant":"PositionBatchUpdate"'
+# Rare enough to send every viewer. After a close there's no room left to
+# snapshot, so overflow viewers would otherwise never hear about it.
+EVERYONE = ('"variant":"roomupdate"',)
+
+DIRECT = "direct"
+OVERFLOW = "overflow"
+
+
+class SpectatorFeed:
+    def __init__(self):
+        self.direct: defaultdict[str, set[Connection]] = defaultdict(lambda: set())
+        self.overflow: defaultdict[str, set[Connection]] = defaultdict(lambda: set())
+        # Rooms that changed since their last snapshot
+        self.dirty: set[str] = set()
+        # Latest shared frames per room
+        self.snapshots: dict[str, Frame] = dict()
+        self.positions: dict[str, Frame] = dict()
+        self.overflow_pending: set[str] = set()
+        self.last_overflow = 0.0
+
+    def watch(self, code: str, conn: Connection):
+        if code in conn.spectating:
+            return
+        if len(self.direct[code]) < SPECTATOR_CAP:
+            conn.spectating[code] = DIRECT
+            self.direct[code].add(conn)
+        else:
+            conn.spectating[code] = OVERFLOW
+            self.overflow[code].add(conn)
+            metrics.incr("spectators.overflowed")
+        # Start them off with the current state
+        self.dirty.add(code)
+
+    def unwatch(self, conn: Connection, code: str | None = None):
+        # No code: stop spectating everything (socket closed)
+        for c in list(conn.spectating) if code is None else [code]:
+            if conn.spectating.pop(c, None) is not None:
+                self._remove(c, conn)
+
+    def _remove(self, code: str, conn: Connection):
+        self.direct[code].discard(conn)
+        self.overflow[code].discard(conn)
+        # Promote someone from overflow into the freed slot
+        if self.overflow[code] and len(self.direct[code]) < SPECTATOR_CAP:
+            c = self.overflow[code].pop()
+            c.spectating[code] = DIRECT
+            self.direct[code].add(c)
+        if not self.direct[code]:
+            del self.direct[code]
+        if not self.overflow[code]:
+            del self.overflow[code]
+        if code not in self.direct and code not in self.overflow:
+            self.forget(code)
+
+    def set_spectating(self, code: str, conns: set[Connection], spectating: bool):
+        for conn in list(conns):
+            if spectating:
+                self.watch(code, conn)
+            else:
+                self.unwatch(conn, code)
+
+    def offer(self, code: str, frame: Frame, binary: Frame | None) -> str | None:
+        # Called for every room event, returns the lowest tier that should get
+        # it right away (OVERFLOW: everyone, None: snapshots only)
+        if code not in self.direct and code not in self.overflow:
+            return OVERFLOW
+        # Only position batches come with a binary encoding
+        if binary is not None or POSITIONS in frame.text:
+            self.positions[code] = frame
+            return None
+        self.dirty.add(code)
+        if any(n in frame.text for n in SNAPSHOT_ONLY):
+            return None
+        if any(n in frame.text for n in EVERYONE):
+            return OVERFLOW
+        return DIRECT
+
+    def forget(self, code: str):
+        self.dirty.discard(code)
+        self.snapshots.pop(code, None)
+        self.positions.pop(code, None)
+        self.overflow_pending.discard(code)
+
+    def snapshot(self, code: str) -> Frame | None:
+        from models.ws import SpectatorSnapshot
+        from room_manager import mg
+        from rooms import get_room_from_code
+        room = get_room_from_code(code)
+        if room is None:
+            return None
+        log = mg.logs.get(code)
+        return Frame.of(SpectatorSnapshot(seq=log.seq if log is not None else 0, room=room))
+
+    def tick(self, now: float | None = None):
+        now = time.monotonic() if now is None else now
+        dirty, self.dirty = self.dirty, set()
+        for code in dirty:
+            if code not in self.direct and code not in self.overflow:
+                self.forget(code)
+                continue
+            frame = self.snapshot(code)
+            if frame is None:
+                continue
+            self.snapshots[code] = frame
+            self.overflow_pending.add(code)
+            metrics.incr("spectators.snapshots")
+            for conn in self.direct.get(code, ()):
+                conn.send(frame if conn.room == code else frame.public())
+        positions, self.positions = self.positions, dict()
+        for code, frame in positions.items():
+            for conn in self.direct.get(code, ()):
+                conn.send(frame)
+
+        if now - self.last_overflow >= OVERFLOW_INTERVAL:
+            self.last_overflow = now
+            pending, self.overflow_pending = self.overflow_pending, set()
+            for code in pending:
+                frame = self.snapshots.get(code)
+                if frame is None:
+                    continue
+                for conn in self.overflow.get(code, ()):
+                    conn.send(frame if conn.room == code else frame.public())
+
+    def stats(self) -> dict:
+        return {
+            "direct": sum(len(v) for v in self.direct.values()),
+            "overflow": sum(len(v) for v in self.overflow.values()),
+            "rooms": len(self.direct.keys() | self.overflow.keys()),
+        }
+
+
+SPECTATORS = SpectatorFeed()
+metrics.register_collector("spectators", SPECTATORS.stats)
+
+
+async def spectator_task():
+    while True:
+        await asyncio.sleep(SNAPSHOT_INTERVAL)
+        try:
+            SPECTATORS.tick()
+        except Exception as e:
+            print(f"Warning: Spectator snapshot failed: {e}")
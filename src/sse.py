@@ -0,0 +1,78 @@
+import asyncio
+from typing import AsyncIterator
+
+from fastapi.responses import StreamingResponse
+
+import metrics
+from utils import env_float
+
+# Seconds between keepalive comments, so proxies don't drop idle streams
+KEEPALIVE = env_float("DRAAFT_SSE_KEEPALIVE", 15)
+PING = b": ping\n\n"
+
+
+class SseFeed:
+    """
+    One server-sent-events stream that any number of viewers can hold open.
+
+    publish() encodes the event once; every subscriber is handed the same
+    bytes, and only when the payload actually changed.
+    """
+
+    def __init__(self, name: str, payload: str | bytes | None = None):
+        self.name = name
+        self.event = b""
+        self.subscribers = 0
+        self.changed = asyncio.Event()
+        if payload is not None:
+            self.publish(payload)
+
+    def publish(self, payload: str | bytes):
+        data = payload.encode() if isinstance(payload, str) else payload
+        event = b"event: update\ndata: " + data.replace(b"\n", b"\ndata: ") + b"\n\n"
+        if event == self.event:
+            return
+        self.event = event
+        metrics.incr(f"sse.{self.name}.published")
+        # Wake everyone up and give the next round a fresh event to wait on
+        changed, self.changed = self.changed, asyncio.Event()
+        changed.set()
+
+    async def stream(self) -> AsyncIterator[bytes]:
+        self.subscribers += 1
+        try:
+            sent = self.event
+            if sent:
+                yield sent
+            while True:
+                # Anything published while we were suspended at a yield went
+                # to an event we weren't waiting on yet, so check first
+                if self.event is not sent:
+                    sent = self.event
+                    yield sent
+                    continue
+                try:
+                    await asyncio.wait_for(self.changed.wait(), KEEPALIVE)
+                except asyncio.TimeoutError:
+                    yield PING
+        finally:
+            self.subscribers -= 1
+
+    def response(self) -> StreamingResponse:
+        return StreamingResponse(
+            self.stream(),
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        )
+
+
+FEEDS: list[SseFeed] = list()
+
+
+def feed(name: str, payload: str | bytes | None = None) -> SseFeed:
+    f = SseFeed(name, payload)
+    FEEDS.append(f)
+    return f
+
+
+metrics.register_collector("sse", lambda: {f.name: f.subscribers for f in FEEDS})
@@ -159,6 +159,15 @@ def persistent_token(length: int, name: str):
     return res
 
 
+def env_float(name: str, default: float) -> float:
+    # Tunables live in the environment so prod can change them without a deploy
+    from os import environ
+    try:
+        return float(environ[name])
+    except (KeyError, ValueError):
+        return default
+
+
 def serialize_list(l: list) -> str:
     # TODO - should generically serialize any list
     # right now assumed list[BaseModel]
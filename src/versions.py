@@ -0,0 +1,156 @@
+import asyncio
+import time
+from collections import deque
+from typing import Any
+
+import metrics
+from frames import Frame
+from utils import env_float
+
+# Every change to a room bumps its version and produces a JSON patch
+# (RFC 6902) against the previous version. Patches get pushed over /listen
+# and served from /room?since=<version>, so resyncing costs the changes
+# instead of the whole room, advancements and all.
+#
+# Mutations only mark the room dirty. Once per tick each dirty room is loaded
+# and diffed once, however many mutations or clients there were.
+PATCH_TICK = env_float("DRAAFT_PATCH_TICK", 0.1)
+# Patches kept per room; older bases get the full room instead
+PATCH_HISTORY = int(env_float("DRAAFT_PATCH_HISTORY", 64))
+
+
+def _escape(key: str) -> str:
+    return key.replace("~", "~0").replace("/", "~1")
+
+
+def diff(old: Any, new: Any, path: str = "") -> list[dict]:
+    """
+    Minimal-ish JSON patch turning old into new. Objects are diffed key by
+    key, lists that only grew (picks, mostly) get appends, anything else that
+    changed is replaced outright.
+    """
+    if old == new:
+        return []
+    if isinstance(old, dict) and isinstance(new, dict):
+        ops = list()
+        for k, v in old.items():
+            if k not in new:
+                ops.append({"op": "remove", "path": f"{path}/{_escape(k)}"})
+            else:
+                ops.extend(diff(v, new[k], f"{path}/{_escape(k)}"))
+        for k, v in new.items():
+            if k not in old:
+                ops.append({"op": "add", "path": f"{path}/{_escape(k)}", "value": v})
+        return ops
+    if isinstance(old, list) and isinstance(new, list) and len(new) > len(old) and new[:len(old)] == old:
+        return [{"op": "add", "path": f"{path}/-", "value": v} for v in new[len(old):]]
+    return [{"op": "replace", "path": path, "value": new}]
+
+
+class RoomVersion:
+    __slots__ = ("version", "doc", "patches")
+
+    def __init__(self, doc: dict):
+        # Same trick as RoomLog: a version from before a restart reads as
+        # unknown instead of matching something else
+        self.version = int(time.time() * 1000)
+        self.doc = doc
+        self.patches: deque[tuple[int, list[dict]]] = deque(maxlen=PATCH_HISTORY)
+
+    def since(self, version: int) -> list[dict] | None:
+        # Every op after `version`, or None if we can't get there from it
+        if version == self.version:
+            return []
+        if version > self.version or not self.patches or version < self.patches[0][0] - 1:
+            return None
+        return [op for v, ops in self.patches if v > version for op in ops]
+
+
+class RoomVersions:
+    def __init__(self):
+        self.rooms: dict[str, RoomVersion] = dict()
+        self.dirty: set[str] = set()
+
+    def touch(self, code: str):
+        # Only rooms somebody has synced to are worth diffing
+        if code in self.rooms:
+            self.dirty.add(code)
+
+    def forget(self, code: str):
+        self.rooms.pop(code, None)
+        self.dirty.discard(code)
+
+    def observe(self, room) -> tuple[int, int, list[dict]] | None:
+        # Returns (base, version, ops) if the room changed since we last saw it
+        self.dirty.discard(room.code)
+        doc = room.model_dump(mode="json")
+        rv = self.rooms.get(room.code)
+        if rv is None:
+            self.rooms[room.code] = RoomVersion(doc)
+            return None
+        ops = diff(rv.doc, doc)
+        if not ops:
+            return None
+        base = rv.version
+        rv.version += 1
+        rv.doc = doc
+        rv.patches.append((rv.version, ops))
+        metrics.incr("versions.patches")
+        metrics.incr("versions.ops", len(ops))
+        return base, rv.version, ops
+
+    def current(self, code: str) -> RoomVersion | None:
+        # Brings the room up to date first if it has pending changes
+        if code in self.dirty or code not in self.rooms:
+            from rooms import get_room_from_code
+            room = get_room_from_code(code)
+            if room is None:
+                self.forget(code)
+                return None
+            return self.sync(room)
+        return self.rooms.get(code)
+
+    def sync(self, room) -> RoomVersion:
+        # For when we have the room loaded anyway
+        self.publish(room)
+        return self.rooms[room.code]
+
+    def publish(self, room):
+        # Patches are per process (each worker numbers its own), so they go
+        # straight to our sockets instead of over the bus. Members only: the
+        # ops carry seeds, and followers get redacted snapshots instead.
+        from models.ws import RoomPatch
+        from room_manager import mg
+        change = self.observe(room)
+        if change is None:
+            return
+        base, version, ops = change
+        conns = [c for c in mg.rooms.get(room.code, ()) if c.room == room.code]
+        if conns:
+            mg.send_to(room.code, conns, Frame.of(RoomPatch(base=base, version=version, ops=ops)))
+
+    def flush(self):
+        from rooms import get_room_from_code
+        dirty, self.dirty = self.dirty, set()
+        for code in dirty:
+            room = get_room_from_code(code)
+            if room is None:
+                self.forget(code)
+                continue
+            self.publish(room)
+
+    def stats(self) -> dict:
+        return {"rooms": len(self.rooms), "dirty": len(self.dirty)}
+
+
+VERSIONS = RoomVersions()
+metrics.register_collector("versions", VERSIONS.stats)
+
+
+async def versions_task():
+    while True:
+        await asyncio.sleep(PATCH_TICK)
+        try:
+            VERSIONS.flush()
+        except Exception as e:
+            print(f"Warning: Room patch flush failed: {e}")